@@ -43,7 +43,11 @@ buzzer = {
 
 
 feedback = {
-    "active"        : True
+    "active"        : True,
+    "control"       : False,    # PI control of the T1 duty factor by the wheel encoder counts
+    "samplePeriod"  : 100,      # ms
+    "kP"            : 0.02,     # duty factor per tick
+    "kI"            : 0.005     # duty factor per tick
 }
 
 
@@ -55,23 +59,44 @@ i2c = {
 }
 
 
+logger = {
+    "format"        : "text",   # "text" or "binary" (compact records, tools/ubot_logdecoder.py decodes them)
+    "bufferSize"    : 16,       # items per log type
+    "flushSize"     : 8,        # items
+    "flushPeriod"   : 5000,     # ms
+    "maxBytes"      : 32768,    # bytes per log directory
+    "maxFiles"      : 20,       # boots per log directory
+    "repeatWindow"  : 10000,    # ms, repeats of the same exception are only counted within this
+    "repeatLimit"   : 8,        # different exceptions counted at once
+    "indexPeriod"   : 32        # records between two time index entries
+}
+
+
 motor = {
     "active"        : True,
     "T0Period"      : 10,
     "T0Duration"    : 6,
+    "T0Mode"        : "timer",  # "timer" or "pwm" (needs inactive UART, the PWM frequency is T1Frequency)
+    "T0Duty"        : 750,
+    "T0DutyFactor"  : 1.0,
     "T1Frequency"   : 1000,
     "T1Duty"        : 750,
     "T1DutyFactor"  : 1.0,
     "T1MinDuty"     : 500,
     "T1MaxDuty"     : 1023,
-    "breathLength"  : 0
+    "breathLength"  : 0,
+    "coalesce"      : False,    # adjacent moves in the same direction run as one (no stop, no breath between them)
+    "rampLength"    : 0,        # ms, acceleration ramp at the start and at the end of moves (0 - off)
+    "rampStep"      : 20,       # ms, length of a ramp step
+    "tickTimeout"   : 50        # ms per encoder tick, safety net of the moves by ticks
 }
 
 
 system = {
     "firmware"      : (0, 1, 113),
     "initDateTime"  : (2021, 2, 24, 0, 22, 10, 0, 0),
-    "powerOnCount"  : 0
+    "powerOnCount"  : 0,
+    "flushPeriod"   : 2000  # ms    Pending config changes and RTC saves are written out together.
 }
 
 
@@ -79,9 +104,13 @@ turtle = {
     "active"        : True,
     "moveLength"    : 890,
     "turnLength"    : 359,
+    "moveTicks"     : 0,    # encoder ticks of "F" and "B" instead of moveLength (0 - off, needs feedback)
     "breathLength"  : 500,
     "loopChecking"  : 1,    #  0 - off  #  1 - simple (max. 20)  #  2 - simple (no limit)
+    "lookahead"     : 8,    # moves booked ahead on the motor queue during execution
+    "feedBudget"    : 64,   # max. instructions interpreted at once
     "stepSignal"    : "step",
+    "stepTiming"    : "overlapped", # "strict" - the step signal delays the next move, "overlapped" - it plays meanwhile
     "endSignal"     : "ready",
 
     "checkPeriod"   : 20,   # ms
@@ -117,6 +146,7 @@ configModules = {
     "buzzer"    : buzzer,
     "feedback"  : feedback,
     "i2c"       : i2c,
+    "logger"    : logger,
     "motor"     : motor,
     "system"    : system,
     "turtle"    : turtle,
@@ -252,12 +282,13 @@ def setup():
         file.write("{}\nFallback event log initialised successfully.\n\n".format(system.get("initDateTime")))
 
 
+    uos.mkdir("etc/config")
+
     for moduleName, module in configModules.items():
-        uos.mkdir("etc/{}".format(moduleName))
-        for attrName, attrValue in module.items():
-            with open("etc/{}/{}.txt".format(moduleName, attrName), "w") as file:
-                file.write("{}\n".format(ujson.dumps(attrValue)))
-            with open("etc/{}/{}.def".format(moduleName, attrName), "w") as file:
-                file.write("{}\n".format(ujson.dumps(attrValue)))
+        serialized = "{}\n".format(ujson.dumps(module))
+        with open("etc/config/{}.txt".format(moduleName), "w") as file:
+            file.write(serialized)
+        with open("etc/config/{}.def".format(moduleName), "w") as file:
+            file.write(serialized)
 
     return vfs
@@ -31,79 +31,265 @@
 
 import uos
 
-from machine import Pin, PWM
+from array   import array
+from machine import Pin, PWM, Timer
 from utime   import sleep_ms
 from ujson   import loads
 
 import ubot_config as config
+import ubot_logger as logger
 
 
 _buzzerActive = config.get("buzzer", "active")
 _pwm          = PWM(Pin(15), 0, 0)
 _defaultState = 0
 
+_timer        = Timer(-1)                       # Tone sequencer: plays the queued tones in the background.
+_queueSize    = 64                              # Capacity of the tone queue.
+_toneFreq     = array("H", [0] * _queueSize)    # Ring buffer of tones: frequency in Hz (0 - rest)
+_toneLength   = array("H", [0] * _queueSize)    #                       and length in ms.
+_toneHead     = 0                               # Index of the next tone.
+_toneCount    = 0                               # Queued tones.
+_playing      = False
+_priority     = 0                               # Priority of the queued tones.
+
+_midiFreq     = array("H", [round(440 * pow(2, (note - 69) / 12)) for note in range(128)])    # MIDI note -> Hz
+_tunes        = {}                              # Compiled tunes by keys: array("H", [freq, length, freq, length, ...])
+
 
 
 ################################
 ## PUBLIC METHODS
 
-def keyBeep(key):
-    tuneList = config.get("buzzer", key)
+def keyBeep(key, blocking = False, priority = 0):
+    """
+    Plays the tune of the key (buzzer config). By default it is queued and played in the background, see play().
+    If blocking is True, it cancels the queued tones and plays the tune before returning.
+    The tunes are compiled at import and when the buzzer config changes, so this is a dict lookup.
+    """
+    tune = _tunes.get(key)
 
-    if tuneList != None:
-        if isinstance(tuneList[0], list):
-            for tune in tuneList:
-                if tune[0] == None:
-                    rest(tune[1])
-                else:
-                    midiBeep(tune[0], tune[1], tune[2], tune[3])
-        else:
-            if tuneList[0] == None:
-                rest(tuneList[1])
-            else:
-                midiBeep(tuneList[0], tuneList[1], tuneList[2], tuneList[3])
+    if tune != None:
+        if blocking:
+            cancel()
+
+            for i in range(0, len(tune), 2):
+                _playBlocking(tune[i], tune[i + 1])
+
+            _setDutyByDefaultState()
+        elif _reserve(priority):
+            for i in range(0, len(tune), 2):
+                _push(tune[i], tune[i + 1])
 
 
-def midiBeep(noteOn = 69, duration = 100, restAround = 100, count = 1):
-        freq = 440 * pow(2, (noteOn - 69) / 12)
-        beep(freq, duration, restAround, count)
+def midiBeep(noteOn = 69, duration = 100, restAround = 100, count = 1, blocking = True):
+        freq = _midiFreq[noteOn] if isinstance(noteOn, int) and 0 <= noteOn < 128 else 440 * pow(2, (noteOn - 69) / 12)
+        beep(freq, duration, restAround, count, blocking)
 
 
-def beep(freq = 440.0, duration = 100, restAround = 100, count = 1):
+def beep(freq = 440.0, duration = 100, restAround = 100, count = 1, blocking = True):
+    """ Queues the beep(s), or if blocking is True, cancels the queued tones and plays them before returning. """
+    if blocking:
+        cancel()                        # The sequencer would fight over the PWM: its callbacks run during sleep_ms().
+
     for i in range(count):
-        rest(restAround)
+        rest(restAround, blocking)
 
-        if _buzzerActive:
-            _pwmBeep(freq, duration)
+        if not blocking:
+            _push(round(freq), duration)
         else:
-            _pwm.duty(1023)
-            sleep_ms(duration)
+            _playBlocking(round(freq), duration)
+
+        rest(restAround, blocking)
+
+
+def rest(duration = 100, blocking = True):
+    if not blocking:
+        _push(0, duration)
+    else:
+        cancel()
+        _pwm.duty(0)
+        sleep_ms(duration)
+        _setDutyByDefaultState()
+
+
+def play(tones, priority = 0):
+    """
+    Queues the tones: ((freq in Hz, length in ms), ...), freq 0 is a rest. The tone sequencer plays them
+    in the background by a timer, so it returns immediately. Higher priority pre-empts (cancels) the queued tones,
+    lower priority is dropped while they are playing, same priority is appended. Returns False, if it is dropped.
+    """
+    if not _reserve(priority):
+        return False
+
+    for tone in tones:
+        _push(tone[0], tone[1])
 
-        rest(restAround)
+    return True
 
 
-def rest(duration = 100):
-    _pwm.duty(0)
-    sleep_ms(duration)
+def cancel():
+    """ Stops the tone sequencer and drops the queued tones. """
+    global _toneCount
+    global _playing
+
+    _timer.deinit()
+    _toneCount = 0
+    _playing   = False
     _setDutyByDefaultState()
 
 
+def isPlaying():
+    return _playing
+
+
 def setDefaultState(value = 0):
     global _defaultState
 
     _defaultState = value
-    _setDutyByDefaultState()
+
+    if not _playing:
+        _setDutyByDefaultState()
 
 
 
 ################################
 ## PRIVATE, HELPER METHODS
 
-def _pwmBeep(freq = 440.0, duration = 100):
-    _pwm.freq(round(freq))
-    _pwm.duty(512)
-    sleep_ms(duration)
+def _compileTune(key):
+    """
+    Compiles the tune of the key into a flat array of tones: [freq, length, ...] (freq 0 - rest).
+    A tune is a note (MIDI note, duration, rest around, count), a rest (None, duration), or a list / tuple of them.
+    A malformed tune is logged and dropped, so it is silent instead of breaking the import.
+    """
+    tuneList = config.get("buzzer", key)
+
+    if not isinstance(tuneList, (list, tuple)) or len(tuneList) == 0:
+        _tunes.pop(key, None)
+        return
+
+    if not isinstance(tuneList[0], (list, tuple)):
+        tuneList = (tuneList,)
+
+    tones = []
+
+    try:
+        for tune in tuneList:
+            if tune[0] == None:
+                _appendTone(tones, 0, tune[1])
+            else:
+                for i in range(tune[3]):
+                    _appendTone(tones, 0, tune[2])
+                    _appendTone(tones, _midiFreq[tune[0]], tune[1])
+                    _appendTone(tones, 0, tune[2])
+
+        _tunes[key] = array("H", tones)
+    except Exception as e:
+        _tunes.pop(key, None)
+        logger.append(e)
+
+
+def _appendTone(tones, freq, length):
+    """ Appends the tone to the flat list, but skips the empty ones and merges the adjacent rests. """
+    if 0 < length:
+        if freq == 0 and 0 < len(tones) and tones[-2] == 0:
+            tones[-1] += length
+        else:
+            tones.extend((freq, length))
+
+
+def _callbackConfig(attribute, value):
+    """ Recompiles the changed tune. (Subscribed in ubot_config.) """
+    global _buzzerActive
+
+    if attribute == "active":
+        _buzzerActive = value
+    else:
+        _compileTune(attribute)
+
+
+def _reserve(priority):
+    """ Applies the priority rules of play() before queueing tones. """
+    global _priority
+
+    if _playing:
+        if priority < _priority:
+            return False
+        elif _priority < priority:
+            cancel()
+
+    _priority = priority
+    return True
+
+
+def _push(freq, length):
+    """ Queues the tone, but skips the empty ones and merges the adjacent rests, like _appendTone(). """
+    global _toneCount
+
+    last = (_toneHead + _toneCount - 1) % _queueSize
+
+    if freq == 0 and 0 < _toneCount and _toneFreq[last] == 0 and _toneLength[last] + length < 65536:
+        _toneLength[last] += length
+    elif 0 < length and _toneCount < _queueSize:
+        slot = (_toneHead + _toneCount) % _queueSize
+        _toneFreq[slot]   = freq
+        _toneLength[slot] = length
+        _toneCount += 1
+
+        if not _playing:
+            _playNext()
+
+
+def _playNext(timer = None):
+    """ Callback of the sequencer timer: starts the next tone for its length, or stops at the end of the queue. """
+    global _toneHead
+    global _toneCount
+    global _playing
+
+    if _toneCount == 0:
+        _playing = False
+        _setDutyByDefaultState()
+        return
+
+    freq      = _toneFreq[_toneHead]
+    length    = _toneLength[_toneHead]
+    _toneHead = (_toneHead + 1) % _queueSize
+    _toneCount -= 1
+    _playing  = True
+
+    if freq == 0:
+        _pwm.duty(0)
+    elif _buzzerActive:
+        _pwm.freq(freq)
+        _pwm.duty(512)
+    else:
+        _pwm.duty(1023)
+
+    _timer.init(period = length, mode = Timer.ONE_SHOT, callback = _playNext)
+
+
+def _playBlocking(freq, length):
+    if freq == 0:
+        _pwm.duty(0)
+    elif _buzzerActive:
+        _pwm.freq(freq)
+        _pwm.duty(512)
+    else:
+        _pwm.duty(1023)
+
+    sleep_ms(length)
 
 
 def _setDutyByDefaultState():
     _pwm.duty(1023 * _defaultState)
+
+
+
+################################
+## INITIALISATION
+
+for key in config.getModule("buzzer"):
+    if key != "active":
+        _compileTune(key)
+
+config.subscribe("buzzer", None, _callbackConfig)
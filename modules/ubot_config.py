@@ -31,7 +31,24 @@
 
 import ujson, uos
 
-from machine import RTC
+from machine import RTC, Timer
+
+
+_cache       = {}                                           # Deserialized config stores: {"module" : {"attribute" : value}}
+_cacheHits   = 0
+_cacheMisses = 0
+
+_compiledVersion = 1                                        # Format of etc/config_compiled.py, compile() writes it.
+_compiledPath    = "etc/config_compiled.py"
+
+_dirtyModules  = []                                         # Modules with pending (not yet written) changes.
+_dirtyDateTime = False
+_flushPeriod   = 2000                                       # ms, the pending writes are collapsed in this window.
+_flushTimer    = Timer(-1)
+_flushArmed    = False
+_flushGuard    = None                                       # Callable: while it returns True, the timed flush waits.
+
+_subscribers   = {}                                         # {"module/attribute" : [callback, ...]}, "module/" : every attribute
 
 
 
@@ -39,22 +56,46 @@ from machine import RTC
 ## PUBLIC METHODS
 
 def get(module, attribute):
-    """ Returns the value of the attribute, or None. Firstly reads it from file, then deserializes it. """
-    return _manageAttribute(module, attribute, "r")
+    """ Returns the value of the attribute, or None. At the first access the whole module store is read and cached. """
+    try:
+        return _getModuleValues(module).get(attribute)
+    except Exception as e:
+        logger.append(e)
+
+
+def getModule(module):
+    """ Returns a copy of the whole module store as a dictionary, or None. One read at most, even at the first access. """
+    try:
+        return _getModuleValues(module).copy()
+    except Exception as e:
+        logger.append(e)
+
+
+def getMany(module, attributes):
+    """ Returns the values of the given attributes as a tuple. Missing attributes are None. """
+    try:
+        values = _getModuleValues(module)
+        return tuple(values.get(attribute) for attribute in attributes)
+    except Exception as e:
+        logger.append(e)
+        return (None,) * len(attributes)
 
 
 def getDefault(module, attribute):
-    """ Returns the default value of the attribute, or None. Firstly reads it from file, then deserializes it. """
-    return _manageAttribute(module, attribute, "r", None, "def")
+    """ Returns the default value of the attribute, or None. Reads it from the default store of the module. """
+    try:
+        return _readModule(module, "def").get(attribute)
+    except Exception as e:
+        logger.append(e)
 
 
 def restore(module, attribute):
     try:
-        value = _manageAttribute(module, attribute, "r", None, "def")   # Read the default config value if it exists
-        _manageAttribute(module, attribute, "w", value)                 # Replace the config file
+        value = _readModule(module, "def")[attribute]   # Read the default config value if it exists
+        _setValue(module, attribute, value)             # Replace the value in the config store
         logger.append(
-            ("Configuration: etc/{dir}/{file}.txt could not be read. "
-             "It has been replaced with etc/{dir}/{file}.def").format(dir = module, file = attribute)
+            ("Configuration: {attr} in etc/config/{module}.txt could not be read. "
+             "It has been replaced with the value from etc/config/{module}.def").format(module = module, attr = attribute)
         )
         return value
     except Exception as e:
@@ -62,9 +103,125 @@ def restore(module, attribute):
 
 
 def set(module, attribute, value):
-    """ Sets the value of the attribute. Firstly serializes it and then writes it out. """
-    _manageRelated(module, attribute, value)    # Can not be at _manageAttribute's mode == "w" branch: too deep.
-    return _manageAttribute(module, attribute, "w", value)
+    """
+    Sets the value of the attribute. The new value is readable immediately, but the module store is written out
+    only at the next flush(): repeated writes within the flush period collapse into one flash write.
+    """
+    _manageRelated(module, attribute, value)
+    try:
+        _setValue(module, attribute, value)
+    except Exception as e:
+        logger.append(e)
+
+
+def flush(timer = None):
+    """
+    Writes out the pending changes (module stores, compiled module, RTC). Returns the count of written files.
+    If it is called by the flush timer while the flush guard returns True, it is postponed by a flush period.
+    """
+    global _dirtyDateTime
+    global _flushArmed
+
+    if timer != None and _flushGuard != None and _flushGuard():
+        _flushTimer.init(period = _flushPeriod, mode = Timer.ONE_SHOT, callback = flush)
+        return 0
+
+    _flushTimer.deinit()
+    _flushArmed = False
+    written     = 0
+    recompile   = False
+
+    while 0 < len(_dirtyModules):
+        module = _dirtyModules.pop()
+        try:
+            _writeModule(module, _cache[module])
+            written += 1
+            recompile = recompile or module != "system"
+        except Exception as e:
+            logger.append(e)
+
+    if recompile and compile():
+        written += 1
+
+    if _dirtyDateTime:
+        _dirtyDateTime = False
+        try:
+            with open("etc/datetime.py", "w") as file:
+                file.write("DT = {}".format(dateTime.datetime()))
+            written += 1
+        except Exception as e:
+            logger.append(e)
+
+    return written
+
+
+def setFlushPeriod(period):
+    """ Setter for the write-coalescing window in ms. 0 means every change is written out immediately. """
+    global _flushPeriod
+
+    _flushPeriod = period
+
+
+def setFlushGuard(guard):
+    """
+    Setter for the flush guard: a callable which returns True while flash writes would disturb
+    timing-critical work (e.g. motor.isProcessing). None: the timed flush is never postponed.
+    """
+    global _flushGuard
+
+    _flushGuard = guard
+
+
+def compile():
+    """
+    Emits the current config as etc/config_compiled.py, a module of constant dicts,
+    which can be imported at the next boot instead of reading and parsing the stores.
+
+    The system store is left out: it is rewritten at every boot (power on count), so it stays JSON only.
+    Every write of a module store removes the compiled module first, so a present one is never stale.
+    (If the stores are edited by hand, call compile() or delete etc/config_compiled.py.)
+    """
+    try:
+        with open(_compiledPath + ".tmp", "w") as file:
+            file.write("# Compiled from etc/config/*.txt by ubot_config.compile(). Do not edit.\n\n")
+            file.write("VERSION = {}\n\nCONFIG = {{\n".format(_compiledVersion))
+
+            for fileName in uos.listdir("etc/config"):
+                if fileName[-4:] == ".txt" and fileName != "system.txt":
+                    file.write("    {!r} : {!r},\n".format(fileName[:-4], _getModuleValues(fileName[:-4])))
+
+            file.write("}\n")
+
+        uos.rename(_compiledPath + ".tmp", _compiledPath)
+        return True
+    except Exception as e:
+        logger.append(e)
+        return False
+
+
+def subscribe(module, attribute, callback):
+    """
+    Registers callback(attribute, value) to call after every set() or restore() of the attribute.
+    If attribute is None, the callback gets the changes of every attribute of the module.
+    """
+    key = "{}/{}".format(module, "" if attribute == None else attribute)
+
+    if key in _subscribers:
+        _subscribers[key].append(callback)
+    else:
+        _subscribers[key] = [callback]
+
+
+def unsubscribe(module, attribute, callback):
+    try:
+        _subscribers["{}/{}".format(module, "" if attribute == None else attribute)].remove(callback)
+    except (KeyError, ValueError):
+        pass
+
+
+def getCacheStats():
+    """ Returns the cache statistics: (hits, misses, cached modules). """
+    return (_cacheHits, _cacheMisses, len(_cache))
 
 
 def datetime(newDateTime = None):
@@ -76,26 +233,155 @@ def datetime(newDateTime = None):
 
 
 def saveDateTime():
-    try:
-        with open("etc/datetime.py", "w") as file:
-            file.write("DT = {}".format(dateTime.datetime()))
-    except Exception as e:
-        logger.append(e)
+    """ Marks the RTC to save into etc/datetime.py at the next flush(). """
+    global _dirtyDateTime
+
+    _dirtyDateTime = True
+    _scheduleFlush()
 
 
 
 ################################
 ## PRIVATE, HELPER METHODS
 
-def _manageAttribute(dir, file, mode, value = None, extension = "txt"):
+def _getModuleValues(module):
+    """ Returns the cached store of the module. If it is not cached yet, reads it in one go. """
+    global _cacheHits
+    global _cacheMisses
+
+    values = _cache.get(module)
+
+    if values != None:
+        _cacheHits += 1
+        return values
+
+    _cacheMisses += 1
+
     try:
-        with open("etc/{}/{}.{}".format(dir, file, extension), mode) as file:
-            if mode == "r":
-                return ujson.loads(file.readline())
-            elif mode == "w":
-                return file.write("{}\n".format(ujson.dumps(value)))
-    except Exception as e:
+        values = _readModule(module)
+    except ValueError as e:                                 # The store is corrupted: replace it with the defaults.
+        logger.append(e)
+        values = _readModule(module, "def")
+        _writeModule(module, values)
+        logger.append(
+            ("Configuration: etc/config/{0}.txt could not be read. "
+             "It has been replaced with etc/config/{0}.def").format(module)
+        )
+    except OSError as e:                                    # There is no store yet: set() will create it.
         logger.append(e)
+        values = {}
+
+    _cache[module] = values
+    return values
+
+
+def _setValue(module, attribute, value):
+    values = _getModuleValues(module).copy()
+    values[attribute] = ujson.loads(ujson.dumps(value))     # Cached as it will be read back from the store. (Tuples...)
+    _cache[module] = values
+
+    if module not in _dirtyModules:                         # The compiled module is removed and rewritten at flush().
+        _dirtyModules.append(module)
+
+    _scheduleFlush()
+    _notify(module, attribute, values[attribute])
+
+
+def _notify(module, attribute, value):
+    for key in ("{}/{}".format(module, attribute), "{}/".format(module)):
+        for callback in _subscribers.get(key, ()):
+            try:
+                callback(attribute, value)
+            except Exception as e:
+                logger.append(e)
+
+
+def _scheduleFlush():
+    global _flushArmed
+
+    if _flushPeriod == 0:
+        flush()
+    elif not _flushArmed:
+        _flushArmed = True
+        _flushTimer.init(period = _flushPeriod, mode = Timer.ONE_SHOT, callback = flush)
+
+
+def _readModule(module, extension = "txt"):
+    with open("etc/config/{}.{}".format(module, extension)) as file:
+        return ujson.load(file)
+
+
+def _writeModule(module, values, extension = "txt"):
+    """ Writes the store to a temporary file and renames it, so a power loss can not leave a half-written store. """
+    path = "etc/config/{}.{}".format(module, extension)
+
+    if extension == "txt" and module != "system":
+        _removeCompiled()
+
+    with open(path + ".tmp", "w") as file:
+        writtenBytes = file.write("{}\n".format(ujson.dumps(values)))
+
+    uos.rename(path + ".tmp", path)
+    return writtenBytes
+
+
+def _removeCompiled():
+    try:
+        uos.remove(_compiledPath)
+    except OSError:                                         # It does not exist.
+        pass
+
+
+def _loadCompiled():
+    """ Seeds the cache from etc/config_compiled.py. Returns True on success. """
+    import etc.config_compiled as compiled
+
+    if compiled.VERSION != _compiledVersion:
+        return False
+
+    _cache.update(compiled.CONFIG)
+    return True
+
+
+def _migrateLegacyStore():
+    """ Converts the per-attribute layout (etc/<module>/<attribute>.txt and .def) into one store per module. """
+    exceptions = []
+
+    if "config" not in uos.listdir("etc"):
+        uos.mkdir("etc/config")
+
+    for entry in list(uos.ilistdir("etc")):
+        if entry[1] != 0x4000 or entry[0] == "config":     # Only the legacy module directories
+            continue
+
+        module   = entry[0]
+        dir      = "etc/{}/".format(module)
+        stores   = {"txt" : {}, "def" : {}}
+        fileList = uos.listdir(dir)
+
+        for fileName in fileList:
+            try:
+                with open(dir + fileName) as file:
+                    stores[fileName[-3:]][fileName[:-4]] = ujson.loads(file.readline())
+            except Exception as e:
+                exceptions.append(e)
+
+        for attribute, value in stores["def"].items():     # Unreadable values are replaced with their defaults.
+            if attribute not in stores["txt"]:
+                stores["txt"][attribute] = value
+
+        storeList = uos.listdir("etc/config")
+
+        for extension, values in stores.items():           # An interrupted migration has already written the store.
+            if "{}.{}".format(module, extension) not in storeList:
+                _writeModule(module, values, extension)
+
+        for fileName in fileList:
+            uos.remove(dir + fileName)
+
+        uos.rmdir(dir)
+
+    return exceptions
 
 
 def _manageRelated(module, attribute, value):
@@ -110,17 +396,42 @@ def _manageRelated(module, attribute, value):
         logger.append(e)
 
 
-def _readOrThrow(dir, file):
-    with open("etc/{}/{}.txt".format(dir, file), "r") as file:
-        return ujson.loads(file.readline())
-
-
 
 ################################
 ## INITIALISATION
 
 initExceptions = []
 
+try:
+    initExceptions = _migrateLegacyStore()
+except Exception as e:
+    initExceptions.append(e)
+
+
+configSource   = "JSON stores (etc/config)"
+compiledLoaded = False
+
+try:
+    compiledLoaded = _loadCompiled()
+    if compiledLoaded:
+        configSource = "etc.config_compiled module"
+except Exception as e:
+    initExceptions.append(e)
+
+
+systemConfig = {}
+
+try:
+    systemConfig = _readModule("system")
+except Exception as e:
+    initExceptions.append(e)
+
+    try:
+        systemConfig = _readModule("system", "def")
+    except Exception as e:
+        initExceptions.append(e)
+
+
 dateTime       = RTC()
 dateTimeSource = "factory default"
 
@@ -132,8 +443,7 @@ except Exception as e:
     initExceptions.append(e)
 
     try:
-        initDateTime = _readOrThrow("system", "initDateTime")
-        dateTime.datetime(initDateTime)
+        dateTime.datetime(systemConfig["initDateTime"])
         dateTimeSource = "firmware default"
     except Exception as e:
         initExceptions.append(e)
@@ -143,16 +453,35 @@ powerOnCount       = 0
 powerOnCountSource = "firmware default"
 
 try:
-    powerOnCount       = _readOrThrow("system", "powerOnCount")
-    powerOnCountSource = "configuration file (etc/system)"
+    powerOnCount       = systemConfig["powerOnCount"]
+    powerOnCountSource = "configuration file (etc/config/system.txt)"
 except Exception as e:
     initExceptions.append(e)
 
-    powerOnCount = int(uos.listdir("log/exception")[-1][:-4])   # [last file][cut extension]
+    powerOnCount = int(uos.listdir("log/exception")[-1][:10])   # [last file][cut extension] (The retention keeps it short.)
     powerOnCountSource = "guessing based on filenames"
 
 powerOnCount += 1                                               # Increment the counter
-_manageAttribute("system", "powerOnCount", "w", powerOnCount)   # and save it
+systemConfig["powerOnCount"] = powerOnCount                     # and save it
+
+try:
+    _writeModule("system", systemConfig)
+    _cache["system"] = systemConfig
+except Exception as e:
+    initExceptions.append(e)
+
+
+if "logger" not in _cache:                                      # ubot_logger reads its settings while it is imported,
+    try:                                                        # so they are preloaded: no logging is possible then.
+        _cache["logger"] = _readModule("logger")
+    except OSError:                                             # There is no store (migrated robots): it is expected,
+        _cache["logger"] = {}                                   # the defaults of ubot_logger are used.
+    except Exception as e:
+        initExceptions.append(e)
+        _cache["logger"] = {}
+
+_flushPeriod = systemConfig.get("flushPeriod", _flushPeriod)
+subscribe("system", "flushPeriod", lambda attribute, value: setFlushPeriod(value))
 
 
 import ubot_logger as logger
@@ -160,5 +489,10 @@ import ubot_logger as logger
 for exception in initExceptions:
     logger.append(exception)
 
+if not compiledLoaded:                                          # Missing or outdated: write it for the next boot.
+    compile()
+
+logger.append("Configuration has been loaded. Source: {}".format(configSource))
+
 logger.append("System RTC has been set. Source: {}".format(dateTimeSource))
 logger.append("'Power on count' has been set. Source: {}".format(powerOnCountSource))
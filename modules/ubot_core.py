@@ -79,6 +79,8 @@ def executeJson(json):
 
 
     if json.get("command"):
+        refused = 0                                                         # Moves not booked: the move queue is full.
+
         for command in json.get("command"):
 
             if command[:6] == "PRESS ":
@@ -88,7 +90,8 @@ def executeJson(json):
 
             elif command[:5] == "STEP ":
                 for char in command[5:].strip():
-                    turtle.move(char)
+                    if not turtle.move(char):
+                        refused += 1
 
             elif command[:5] == "BEEP ":
                 beepArray = command[5:].strip().split(":")
@@ -102,11 +105,20 @@ def executeJson(json):
                 buzzer.rest(int(command[5:].strip()))
 
             elif command[:4] == "MOT ":
-                motor.move(int(command[4]), int(command[6:].strip()))
+                if not motor.move(int(command[4]), int(command[6:].strip())):
+                    refused += 1
+
+            elif command[:6] == "DRIVE ":                                   # DRIVE <left speed>:<right speed>:<duration>
+                driveArray = command[6:].strip().split(":")
+                if not motor.drive(int(driveArray[0]), int(driveArray[1]), int(driveArray[2])):
+                    refused += 1
 
             elif command[:6] == "SLEEP ":
                 sleep_ms(int(command[6:].strip()))
 
+        if 0 < refused:
+            results.append("{} move(s) refused: the move queue is full. (Capacity: {})".format(refused, motor.getQueueCapacity()))
+
 
     if json.get("program"):
         program = json.get("program")
@@ -194,6 +206,55 @@ def executeJson(json):
 
 
 
+################################
+## PRIVATE, HELPER METHODS
+
+def _getMotorConfig():
+    motorConfig = config.getModule("motor")
+
+    return (
+        (motorConfig.get("T0Period"),       motorConfig.get("T0Duration"),
+         round(motorConfig.get("T0DutyFactor", 1.0) * motorConfig.get("T0Duty", 0)) if motorConfig.get("T0Mode") == "pwm" else 0),
+        (motorConfig.get("T1Frequency"),    motorConfig.get("T1Duty")),
+        (motorConfig.get("T1DutyFactor"),   motorConfig.get("T1MinDuty"), motorConfig.get("T1MaxDuty")),
+         motorConfig.get("breathLength"),
+        (motorConfig.get("rampLength", 0),  motorConfig.get("rampStep", 20))
+    )
+
+
+def _callbackMotorConfig(attribute, value):
+    """ Reconfigures the motors with the new settings without reboot. (Subscribed in ubot_config.) """
+    if attribute != "active":
+        motor.configMotor(_getMotorConfig())
+
+        if config.get("turtle", "active"):          # The turtle's breath length overrides the motor's one.
+            motor.setBreath(config.get("turtle", "breathLength"))
+
+        motor.setCoalescing(config.get("motor", "coalesce"))
+
+        if config.get("feedback", "active"):        # The base of the wheel speed control is the T1 duty factor.
+            feedback.configControl(_getControlConfig())
+            motor.setTickSource(feedback.get, config.getModule("motor").get("tickTimeout", 50))
+
+
+def _getControlConfig():
+    feedbackConfig = config.getModule("feedback")
+
+    return (
+        feedbackConfig.get("kP", 0.02),                    # The defaults are the same as in inisetup.py,
+        feedbackConfig.get("kI", 0.005),                   # so migrated robots work like freshly set-up ones.
+        feedbackConfig.get("samplePeriod", 100) if feedbackConfig.get("control", False) and config.get("motor", "active") else 0,
+        config.get("motor", "T1DutyFactor")
+    )
+
+
+def _callbackFeedbackConfig(attribute, value):
+    """ Reconfigures the wheel speed control with the new settings without reboot. (Subscribed in ubot_config.) """
+    if attribute != "active":
+        feedback.configControl(_getControlConfig())
+
+
+
 ################################
 ## INITIALISATION
 
@@ -226,14 +287,13 @@ if config.get("motor", "active"):
             (0, 0) if config.get("uart", "active") else (1, 3), # Right motor - T0
             (4, 5)                                              # Left motor  - T1
         ),
-        (
-            (config.get("motor", "T0Period"),       config.get("motor", "T0Duration")),
-            (config.get("motor", "T1Frequency"),    config.get("motor", "T1Duty")),
-            (config.get("motor", "T1DutyFactor"),   config.get("motor", "T1MinDuty"), config.get("motor", "T1MaxDuty")),
-             config.get("motor", "breathLength")
-        )
+        _getMotorConfig()
     )
 
+    config.subscribe("motor", None, _callbackMotorConfig)
+    config.setFlushGuard(motor.isProcessing)                # Flash writes stall the motor timers: flush between moves.
+    motor.setCoalescing(config.get("motor", "coalesce"))
+
 if config.get("turtle", "active"):
     motor.setBreath(config.get("turtle", "breathLength"))
 
@@ -242,19 +302,21 @@ if config.get("turtle", "active"):
 
 AP = network.WLAN(network.AP_IF)
 
-AP.active(config.get("ap", "active"))
+apActive, apEssid, apPassword = config.getMany("ap", ("active", "essid", "password"))
+
+AP.active(apActive)
 AP.ifconfig(("192.168.11.1", "255.255.255.0", "192.168.11.1", "8.8.8.8"))
 AP.config(authmode = network.AUTH_WPA_WPA2_PSK)
 
 
 try:
-    AP.config(essid = config.get("ap", "essid"))
+    AP.config(essid = apEssid)
 except Exception as e:
     logger.append(e)
 
 
 try:
-    AP.config(password = config.get("ap", "password"))
+    AP.config(password = apPassword)
 except Exception as e:
     logger.append(e)
 
@@ -264,6 +326,11 @@ except Exception as e:
 
 if config.get("feedback", "active"):
     feedback.start()
+    feedback.configControl(_getControlConfig())
+    config.subscribe("feedback", None, _callbackFeedbackConfig)
+
+    if config.get("motor", "active"):   # Moves by encoder ticks: motor.moveTicks()
+        motor.setTickSource(feedback.get, config.getModule("motor").get("tickTimeout", 50))
 
 
 if not config.get("uart", "active"):    # The REPL is attached by default to UART0, detach if it is not active.
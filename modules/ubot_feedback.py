@@ -29,12 +29,23 @@
     SOFTWARE.
 """
 
-from machine import Pin
+from machine import Pin, Timer
+
+import ubot_motor as motor
 
 
 _count = [0, 0]
 _pin   = [0, 0]
 
+_controlTimer  = Timer(-1)
+_controlConfig = (0, 0, 0, 1.0)         # (proportional gain, integral gain, sample period in ms, base T1 duty factor)
+_lastCount     = [0, 0]                 # The counts at the previous sample.
+_integral      = 0                      # Sum of the errors (ticks), the I term of the PI controller.
+_samples       = 0                      # Error statistics: count of the samples (while both wheels were driven),
+_errorSum      = 0                      #   sum of the absolute errors,
+_errorMax      = 0                      #   maximum of the absolute errors,
+_errorLast     = 0                      #   the last error. (Error: T0 ticks - T1 ticks in a sample period.)
+
 
 
 ################################
@@ -81,6 +92,39 @@ def clear():
     global _count
 
     _count = [0, 0]
+    _lastCount[0] = 0
+    _lastCount[1] = 0
+
+
+def configControl(controlConfig):
+    global _controlConfig
+    """
+    Parameter controlConfig: (proportional gain, integral gain, sample period in ms, base T1 duty factor)
+
+    The PI controller compares the counts of the wheels in every sample period while both motors are driven,
+    and corrects the T1 (left motor) duty factor by motor.setFactor(), so the wheels run at the same speed.
+    The gains are duty factor per tick. If the sample period is 0, the controller is off.
+    """
+    _controlConfig = controlConfig
+    stopControl()
+    startControl()
+
+
+def startControl():
+    if 0 < _controlConfig[2]:
+        start()
+        _lastCount[0] = _count[0]
+        _lastCount[1] = _count[1]
+        _controlTimer.init(period = _controlConfig[2], mode = Timer.PERIODIC, callback = _control)
+
+
+def stopControl():
+    _controlTimer.deinit()
+
+
+def getControlStats():
+    """ Returns the error statistics of the controller: (samples, mean absolute error, max. absolute error, last error, T1 duty factor) """
+    return (_samples, _errorSum / _samples if 0 < _samples else 0, _errorMax, _errorLast, motor.getFactor())
 
 
 
@@ -99,3 +143,30 @@ def _increase(index):
     global _count
 
     _count[index] += 1
+
+
+def _control(timer):
+    global _integral
+    global _samples
+    global _errorSum
+    global _errorMax
+    global _errorLast
+    """ Periodic callback: one step of the PI controller. """
+    delta0 = _count[0] - _lastCount[0]
+    delta1 = _count[1] - _lastCount[1]
+    _lastCount[0] = _count[0]
+    _lastCount[1] = _count[1]
+
+    if not motor.isDriving():                       # Only the samples with both wheels at full duty count (no ramp).
+        return
+
+    error      = delta0 - delta1                    # Positive: the right wheel (T0) is faster, T1 needs more duty.
+    _integral += error
+
+    if motor.setFactor(_controlConfig[3] + _controlConfig[0] * error + _controlConfig[1] * _integral) != 0:
+        _integral -= error                          # Anti-windup: the factor is at its border, the sum does not grow.
+
+    _samples   += 1
+    _errorSum  += abs(error)
+    _errorMax   = max(_errorMax, abs(error))
+    _errorLast  = error
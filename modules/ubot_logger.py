@@ -29,83 +29,517 @@
     SOFTWARE.
 """
 
-import uos, usys
+import uio, uos, ustruct, usys
 
-from machine import RTC
+from machine import Timer
+from utime   import localtime, mktime, ticks_add, ticks_diff, ticks_ms
 
 import ubot_config as config
 
 
 _fileName = 0
-                #    Name   | List |   Directory
+
+_settings    = config.getModule("logger") or {}         # Preloaded by ubot_config, missing settings use these defaults:
+_bufferSize  = _settings.get("bufferSize", 16)          # Capacity of the ring buffer per log type. If full, drops the oldest.
+_flushSize   = _settings.get("flushSize", 8)            # Buffered items of a type which trigger a flush.
+_flushPeriod = _settings.get("flushPeriod", 5000)       # ms, the longest time while an item can stay in the buffer.
+_binary      = _settings.get("format", "text") == "binary"  # Compact records, tools/ubot_logdecoder.py decodes them.
+_internLimit = _settings.get("internLimit", 32)         # Count of interned texts per log type. (binary format)
+_internSize  = _settings.get("internSize", 64)          # Only texts up to this length are interned.  (binary format)
+_maxBytes    = _settings.get("maxBytes", 32768)         # Retention budget per log directory: bytes,
+_maxFiles    = _settings.get("maxFiles", 20)            # and boots. (The files of one boot count as one.)
+_repeatTime  = _settings.get("repeatWindow", 10000)     # ms, repeats of an exception within this are only counted,
+_repeatLimit = _settings.get("repeatLimit", 8)          # for this many different exceptions at once.
+_indexPeriod = _settings.get("indexPeriod", 32)         # Records between two entries of the time index. (<boot>.idx)
+
+_extension   = ".bin" if _binary else ".txt"
+
+                #    Name   |    Directory    |       Ring buffer      | Head | Count | Interned texts | Not indexed
 _logFiles = (
-                ["Exception", [], "log/exception/"],
-                ["Event",     [], "log/event/"],
-                ["Object",    [], "log/object/"]
+                ["Exception", "log/exception/", [None] * _bufferSize,  0,     0,      {},              _indexPeriod],
+                ["Event",     "log/event/",     [None] * _bufferSize,  0,     0,      {},              _indexPeriod],
+                ["Object",    "log/object/",    [None] * _bufferSize,  0,     0,      {},              _indexPeriod]
             )
 
+"""
+    Text format: every flush starts with an anchor line: "@ <ticks_ms> <RTC datetime tuple>",
+    then the records follow: "<ticks_ms>\n<item>\n\n". readLog() reconstructs the wall clock time for displaying.
+
+    Binary format: the file starts with _binaryMagic, then records follow.
+    Every record is a header (ticks_ms, tag, event ID, payload length) and an UTF-8 payload.
+
+    Tags: 0 - exception, 1 - event, 2 - object,
+          _tagAnchor - payload: RTC datetime tuple, the wall clock time of the record's ticks_ms,
+          _tagText   - payload: the text of the event ID (interned text).
+
+    An event ID above 0 refers to an interned text, the payload of such a record is empty.
+    Every flush starts with an anchor, so the wall clock time can be reconstructed from the ticks.
+
+    Time index: <boot>.idx beside the log file of the boot. After every _indexPeriod records, the next flush
+    appends an entry (ticks_ms of its anchor, offset of its anchor), so queryLog() can seek near the wanted time.
+"""
+_binaryMagic  = b"uBL\x01"
+_indexFormat  = "<II"
+_recordHeader = "<IBHH"
+_anchorFormat = "<HBBBBBBI"
+_tagAnchor    = 254
+_tagText      = 255
+
+_retainedDirs = ("log/exception/", "log/event/", "log/object/",    # The retention budget applies to these directories.
+                 "log/executed/commands/", "log/executed/datetime/", "log/executed/program/")
+
+_repeats      = {}                                                  # {fingerprint : [window start (ticks_ms), repeat count]}
+
+_flushTimer   = Timer(-1)
+_flushArmed   = False
+_flushedCount = 0
+_droppedCount = 0
+
 
 
 ################################
 ## PUBLIC METHODS
 
 def append(item):
+    """
+    Buffers the item. Exceptions are written out immediately, other items in batches.
+    The repeats of an exception within the repeat window are only counted, a summary ("×N") is written later.
+    """
+    index = _defineIndex(item)
+
+    if index == 0 and _isRepeated(item):
+        return
+
+    _push(_logFiles[index], (ticks_ms(), item))
+
     if _fileName != 0:
+        if index == 0 or _flushSize <= _logFiles[index][4]:
+            _saveFromBuffer(_logFiles[index])
+        else:
+            _scheduleFlush()
+
+
+def flush(timer = None):
+    """ Writes out every buffered item. """
+    global _flushArmed
+
+    _flushTimer.deinit()
+    _flushArmed = False
+
+    _summarizeRepeats()
+
+    for logFile in _logFiles:
+        _saveFromBuffer(logFile)
+
+    for entry in _repeats.values():                                 # Wait for the end of the counting windows.
+        if 0 < entry[1]:
+            _scheduleFlush()
+            break
+
+
+def getFileName():
+    """ Returns the name of the log files of this boot. """
+    return _fileName
+
+
+def getUsage():
+    """ Returns the log budget usage per directory: ((directory, bytes, boots, max. bytes, max. boots), ...) """
+    result = []
+
+    for dir in _retainedDirs:
         try:
-            with open(_logFiles[_defineIndex(item)][2] + _fileName, "a") as file:
-                _writeOutItem(config.datetime(), file, item)
+            boots, total = _listBoots(dir)
+            result.append((dir, total, len(boots), _maxBytes, _maxFiles))
         except Exception as e:
-            _appendToList(e)
-            _appendToList(item)
-    else:
-        _appendToList(item)
+            append(e)
+
+    return result
+
+
+def enforceRetention():
+    """
+    Deletes the files of the oldest boots until every log directory fits in its budget.
+    The fallback files (0000000000.*) and the files of the newest boot are kept. Returns the count of deleted files.
+    """
+    deleted = 0
+
+    for dir in _retainedDirs:
+        try:
+            boots, total = _listBoots(dir)
+
+            while 1 < len(boots) and (_maxBytes < total or _maxFiles < len(boots)):
+                boot = boots.pop(0)
+
+                for fileName in boot[2]:
+                    uos.remove(dir + fileName)
+                    deleted += 1
+
+                total -= boot[1]
+        except Exception as e:
+            append(e)
+
+    try:
+        _compactDateTimeLog()
+    except Exception as e:
+        append(e)
+
+    return deleted
+
+
+def readLog(path):
+    """
+    Yields the lines of a text log file for displaying. The records are stamped with ticks_ms,
+    this replaces them with the wall clock time reconstructed from the anchor ("@ ticks RTC") of their flush.
+    """
+    anchor   = None
+    isHeader = True
+
+    with open(path) as file:
+        for line in file:
+            if line[:2] == "@ ":
+                anchor   = _parseAnchor(line)
+                isHeader = True
+                continue
+
+            if isHeader and anchor != None and line.strip().isdigit():
+                line = "{}\n".format(_wallTime(anchor, int(line)))
+
+            isHeader = line == "\n"
+            yield line
+
+
+def queryLog(logType = "event", boot = None, fromTicks = None, toTicks = None, last = None):
+    """
+    Yields the records of a log as display lines: "<wall clock time>  <text>\n".
+
+    logType   : "exception", "event" or "object"
+    boot      : power on count, default: the current boot
+    fromTicks : ticks_ms, the beginning of the time range (ms since the boot)
+    toTicks   : ticks_ms, the end of the time range
+    last      : instead of fromTicks: only the last N seconds of the boot
+
+    The time index (<boot>.idx) is used to seek near fromTicks, the preceding records are not read.
+    """
+    logFile = _logFiles[("exception", "event", "object").index(logType)]
+    name    = _fileName[:10] if boot == None else "{:010d}".format(boot)
+    current = name == _fileName[:10]
+
+    if current:
+        flush()
+
+    path = ""
+    for extension in (_extension, ".txt", ".bin"):                 # The format may have been changed since that boot.
+        if 0 < _getSize(logFile[1] + name + extension):
+            path = logFile[1] + name + extension
+            break
+
+    if path == "":
+        return
+
+    index   = logFile[1] + name + ".idx"
+    records = _readBinaryRecords if path[-4:] == ".bin" else _readTextRecords
+
+    if last != None:
+        end       = ticks_ms() if current else _getLastTicks(records, path, index)
+        fromTicks = ticks_add(end, -int(last * 1000))
+
+    offset = 0 if fromTicks == None else _findOffset(index, fromTicks)
+
+    for anchor, ticks, text in records(path, offset):
+        if fromTicks != None and ticks_diff(ticks, fromTicks) < 0:
+            continue
+        if toTicks != None and 0 < ticks_diff(ticks, toTicks):
+            break
+
+        yield "{}  {}\n".format(ticks if anchor == None else _wallTime(anchor, ticks), text.rstrip("\n").replace("\n", "\n    "))
+
+
+def getStats():
+    """ Returns the buffer statistics: (flushed items, dropped items, currently buffered items). """
+    return (_flushedCount, _droppedCount, _logFiles[0][4] + _logFiles[1][4] + _logFiles[2][4])
 
 
 
 ################################
 ## PRIVATE, HELPER METHODS
 
-def _appendToList(item):
-    global _logFiles
+def _push(logFile, entry):
+    global _droppedCount
 
-    index = _defineIndex(item)
+    ring = logFile[2]
+
+    if logFile[4] == len(ring):                                     # The buffer is full: drop the oldest item.
+        ring[logFile[3]] = None
+        logFile[3] = (logFile[3] + 1) % len(ring)
+        logFile[4] -= 1
+        _droppedCount += 1
+
+    ring[(logFile[3] + logFile[4]) % len(ring)] = entry
+    logFile[4] += 1
+
+
+def _listBoots(dir):
+    """ Returns the files of the directory grouped by boots, the oldest first: ([[boot, bytes, [files]], ...], total bytes) """
+    boots = []
+    total = 0
+
+    for fileName in sorted(uos.listdir(dir)):
+        if fileName[:10] == "0000000000":                          # The fallback file is not the part of the budget.
+            continue
+
+        size   = uos.stat(dir + fileName)[6]
+        total += size
+
+        if 0 < len(boots) and boots[-1][0] == fileName[:10]:
+            boots[-1][1] += size
+            boots[-1][2].append(fileName)
+        else:
+            boots.append([fileName[:10], size, [fileName]])
+
+    return boots, total
+
+
+def _compactDateTimeLog():
+    """ log/datetime.txt gets two lines at every boot. If it is over the budget, keeps only its newer half. """
+    if _maxBytes < uos.stat("log/datetime.txt")[6]:
+        with open("log/datetime.txt") as file:
+            file.seek(-(_maxBytes // 2), 2)
+            content = file.read()
+
+        with open("log/datetime.txt.tmp", "w") as file:
+            file.write(content[content.find("\n\n") + 2:])       # From the first complete entry.
 
+        uos.rename("log/datetime.txt.tmp", "log/datetime.txt")
+
+
+def _parseAnchor(line):
+    """ "@ 12345 (2021, 2, 24, 0, 22, 10, 0, 0)\n" -> (12345, (2021, 2, 24, 0, 22, 10, 0, 0)) """
+    parts = line.split(" ", 2)
+    return (int(parts[1]), tuple([int(i) for i in parts[2].strip()[1:-1].split(",")]))
+
+
+def _wallTime(anchor, ticks):
+    """ Returns the wall clock time of the ticks_ms stamp as text, based on the anchor: (ticks, RTC datetime tuple) """
+    dt      = anchor[1]
+    elapsed = ticks_diff(ticks, anchor[0]) + dt[7]              # The sub-second field of the RTC: ms (ESP8266)
+    t       = localtime(mktime((dt[0], dt[1], dt[2], dt[4], dt[5], dt[6], 0, 0)) + elapsed // 1000)
+
+    return "{}-{:02d}-{:02d} {:02d}:{:02d}:{:02d}.{:03d}".format(t[0], t[1], t[2], t[3], t[4], t[5], elapsed % 1000)
+
+
+def _getSize(path):
     try:
-        _logFiles[index][1].append((config.datetime(), item))
+        return uos.stat(path)[6]
+    except OSError:
+        return 0
+
+
+def _findOffset(index, fromTicks):
+    """ Returns the offset of the last indexed anchor before fromTicks. (The records preceding it are older.) """
+    offset = 0
 
-        if 30 < len(_logFiles[index][1]):
-            try:
-                _saveFromList(_logFiles[index])
-            except Exception as e:
-                _logFiles[index][1] = _logFiles[index][1][10:]              # Reassign list (Delete the oldest 10 items.)
+    try:
+        with open(index, "rb") as file:
+            entry = file.read(8)
+
+            while len(entry) == 8:
+                entry = ustruct.unpack(_indexFormat, entry)
+
+                if 0 <= ticks_diff(entry[0], fromTicks):
+                    break
+
+                offset = entry[1]
+                entry  = file.read(8)
+    except OSError:                                                 # There is no index: read from the beginning.
+        pass
+
+    return offset
+
+
+def _getLastTicks(records, path, index):
+    """ Returns the ticks_ms of the last record. Reads only the records after the last index entry. """
+    offset = 0
+    last   = 0
+
+    try:
+        with open(index, "rb") as file:
+            file.seek(-8, 2)
+            offset = ustruct.unpack(_indexFormat, file.read(8))[1]
+    except OSError:
+        pass
+
+    for anchor, ticks, text in records(path, offset):
+        last = ticks
+
+    return last
+
+
+def _readTextRecords(path, offset = 0):
+    """ Yields (anchor, ticks, text) tuples from a text log file, starting at offset. """
+    anchor = None
+    ticks  = None
+    lines  = []
+
+    with open(path) as file:
+        file.seek(offset)
+
+        for line in file:
+            if line[:2] == "@ ":
+                anchor = _parseAnchor(line)
+            elif ticks == None:
+                if line.strip().isdigit():                          # Older records (RTC tuple stamps) are skipped.
+                    ticks = int(line)
+            elif line == "\n":
+                yield anchor, ticks, "".join(lines)
+                ticks = None
+                lines = []
+            else:
+                lines.append(line)
+
+
+def _readBinaryRecords(path, offset = 0):
+    """ Yields (anchor, ticks, text) tuples from a binary log file, starting at offset. """
+    anchor = None
+    texts  = {}
+
+    with open(path, "rb") as file:
+        if file.read(len(_binaryMagic)) != _binaryMagic:            # The fallback file has no magic.
+            file.seek(0)
+
+        while True:
+            header = file.read(9)
+
+            if len(header) < 9:
+                break
+
+            ticks, tag, id, length = ustruct.unpack(_recordHeader, header)
+
+            if file.tell() < offset:                                # Before offset: only the interned texts are read.
+                if tag == _tagText:
+                    texts[id] = file.read(length).decode()
+                else:
+                    file.seek(length, 1)
+                continue
+
+            payload = file.read(length)
+
+            if tag == _tagAnchor:
+                anchor = (ticks, ustruct.unpack(_anchorFormat, payload))
+            elif tag == _tagText:
+                texts[id] = payload.decode()
+            else:
+                yield anchor, ticks, texts.get(id, "") if id else payload.decode()
+
+
+def _isRepeated(exception):
+    """ Returns True if the exception is a repeat within the window of its first occurrence, and counts it. """
+    try:
+        key   = _fingerprint(exception)
+        entry = _repeats.get(key)
+        now   = ticks_ms()
 
+        if entry != None and ticks_diff(now, entry[0]) < _repeatTime:
+            entry[1] += 1
+            _scheduleFlush()
+            return True
+
+        if entry == None and _repeatLimit <= len(_repeats):        # Purges the expired windows: only flush() did it,
+            _summarizeRepeats()                                     # which is not scheduled by the one-off exceptions.
+
+        if entry != None or len(_repeats) < _repeatLimit:          # A new window starts with this logged occurrence.
+            _summarizeRepeats(key)
+            _repeats[key] = [now, 0]
     except Exception as e:
         usys.print_exception(e)
-        if index == 0:
-            usys.print_exception(item)
 
+    return False
+
+
+def _summarizeRepeats(key = None):
+    """ Buffers the "×N" records of the finished counting windows (or of the given one) and forgets them. """
+    now = ticks_ms()
+
+    for fingerprint in list(_repeats.keys()):
+        entry = _repeats[fingerprint]
+
+        if fingerprint == key or _repeatTime <= ticks_diff(now, entry[0]):
+            if 0 < entry[1]:
+                _push(_logFiles[0], (now, "Repeated ×{} within {} ms: {}".format(entry[1], ticks_diff(now, entry[0]), fingerprint)))
+            del _repeats[fingerprint]
+
+
+def _fingerprint(exception):
+    """ Type, message and the innermost location of the exception, e.g.: 'OSError: 5 @ File "x.py", line 9, in y' """
+    lines    = _itemToText(exception).strip().split("\n")
+    location = ""
+
+    for line in lines:
+        if line.strip()[:5] == "File ":
+            location = line.strip()
 
-def _saveFromList(logFile, fallback = False):
-    if logFile[1] != []:                                            # If this list contains item(s).
+    return "{} @ {}".format(lines[-1], location)
+
+
+def _scheduleFlush():
+    global _flushArmed
+
+    if not _flushArmed:
+        _flushArmed = True
+        _flushTimer.init(period = _flushPeriod, mode = Timer.ONE_SHOT, callback = flush)
+
+
+def _saveFromBuffer(logFile, fallback = False):
+    global _flushedCount
+
+    count = logFile[4]                                              # Items appended meanwhile stay for the next flush.
+
+    if count != 0:                                                  # If this buffer contains item(s).
 
         if _fileName == 0:                                          # If filename is undefined.
             fallback = True
 
-        fileName = "0000000000.txt" if fallback else _fileName
+        ring      = logFile[2]
+        fileName  = "0000000000" + _extension if fallback else _fileName
+        now       = ticks_ms()
+        indexDue  = not fallback and _indexPeriod <= logFile[6]    # The fallback file is shared by boots: no index.
+        offset    = _getSize(logFile[1] + fileName) if indexDue else 0
         try:
-            with open(logFile[2] + fileName, "a") as file:
-                for item in logFile[1]:
-                    _writeOutItem(item[0], file, item[1])
-            logFile[1] = []
+            with open(logFile[1] + fileName, "ab" if _binary else "a") as file:
+                if _binary:                                         # The wall clock time of the ticks_ms stamps.
+                    _writeOutRecord(file, now, _tagAnchor, 0, ustruct.pack(_anchorFormat, *config.datetime()))
+                else:
+                    file.write("@ {} {}\n".format(now, config.datetime()))
+
+                for i in range(count):
+                    item = ring[(logFile[3] + i) % len(ring)]
+
+                    if _binary:
+                        _writeOutBinaryItem(item[0], file, item[1], logFile, fallback)
+                    else:
+                        _writeOutItem(item[0], file, item[1])
+
+            for i in range(count):
+                ring[(logFile[3] + i) % len(ring)] = None
+
+            logFile[3] = (logFile[3] + count) % len(ring)
+            logFile[4] -= count
+            _flushedCount += count
+
+            if indexDue:
+                with open(logFile[1] + fileName[:10] + ".idx", "ab") as file:
+                    file.write(ustruct.pack(_indexFormat, now, offset))
+                logFile[6] = 0
+
+            logFile[6] += count
         except Exception as e:
             usys.print_exception(e)
 
             if not fallback:
-                _saveFromList(logFile, True)
+                _saveFromBuffer(logFile, True)
 
 
-def _writeOutItem(dateTime, file, item):
-    file.write("{}\n".format(dateTime))
+def _writeOutItem(ticks, file, item):
+    file.write("{}\n".format(ticks))
 
     if _defineIndex(item) == 0:
         usys.print_exception(item, file)
@@ -119,6 +553,42 @@ def _writeOutItem(dateTime, file, item):
     file.write("\n")
 
 
+def _writeOutBinaryItem(ticks, file, item, logFile, fallback = False):
+    tag  = _logFiles.index(logFile)
+    text = _itemToText(item)
+    id   = 0
+
+    if tag != 2 and not fallback and len(text) <= _internSize:     # The fallback file is shared by boots: no interning.
+        table = logFile[5]
+        id    = table.get(text, 0)
+
+        if id == 0 and len(table) < _internLimit:
+            id = len(table) + 1
+            table[text] = id
+            _writeOutRecord(file, ticks, _tagText, id, text.encode())
+
+    _writeOutRecord(file, ticks, tag, id, b"" if id else text.encode())
+
+
+def _writeOutRecord(file, ticks, tag, id, payload):
+    if 65535 < len(payload):
+        payload = payload[:65535]
+
+    file.write(ustruct.pack(_recordHeader, ticks, tag, id, len(payload)))
+    file.write(payload)
+
+
+def _itemToText(item):
+    if _defineIndex(item) == 0:
+        buffer = uio.StringIO()
+        usys.print_exception(item, buffer)
+        return buffer.getvalue()
+    elif isinstance(item, list):
+        return "\n".join([str(i) for i in item])
+    else:
+        return str(item)
+
+
 def _defineIndex(item):
     if isinstance(item, Exception):
         return 0
@@ -132,18 +602,23 @@ def _defineIndex(item):
 ################################
 ## INITIALISATION
 
-_fileName = "{:010d}.txt".format(int(config.get("system", "powerOnCount")))
+_fileName = "{:010d}{}".format(int(config.get("system", "powerOnCount")), _extension)
 
 try:
     with open("log/datetime.txt", "a") as file:
         file.write("{}\n{}\n\n".format(config.datetime(), _fileName))
 except Exception as e:
-    _appendToList(e)
+    append(e)
 
 for logFile in _logFiles:
     try:
-        with open(logFile[2] + _fileName, "w") as file:
-            file.write("{}\n{} log initialised successfully.\n\n".format(config.datetime(), logFile[0]))
-            _saveFromList(logFile)
+        with open(logFile[1] + _fileName, "wb" if _binary else "w") as file:
+            if _binary:
+                file.write(_binaryMagic)
+        _push(logFile, (ticks_ms(), "{} log initialised successfully.".format(logFile[0])))
     except Exception as e:
-        _appendToList(e)
+        append(e)
+
+    _saveFromBuffer(logFile)
+
+enforceRetention()
@@ -29,24 +29,68 @@
     SOFTWARE.
 """
 
+import gc
+
+from array   import array
 from machine import Pin, PWM, Timer
+from utime   import ticks_add, ticks_diff, ticks_ms
 
 
 _active = 0
+_pins   = 0
 _pin    = 0
 _pwm    = 0
+_pwmT0  = 0                                 # T0 in PWM mode: (PWM, PWM), in timer mode: 0
 _config = 0
 _factor = 0
 _breath = 0
 
 _timer      = Timer(-1)
+_rampTimer  = Timer(-1)
 _timerT1    = Timer(-1)
 _timerMotor = [Timer(-1), Timer(-1)]
 _processing = False
-_moveList   = []
-_resumeList = []
 _callbacks  = [(), ()]
 
+_queueSize  = 64                            # Capacity of the move queue, a power of two. (Turtle streams into it.)
+_queueMask  = _queueSize - 1
+_moveQueue  = array("L", [0] * _queueSize)  # Ring buffer of moves packed into integers: amount << 4 | isTicks << 3 | direction
+_speedQueue = array("H", [0] * _queueSize)  # Speeds of the DRIVE moves by slots: (left + 100) << 8 | (right + 100)
+_moveHead   = 0                             # Index of the next move.
+_moveSlot   = 0                             # Index of the current move.
+_moveCount  = 0                             # Pending moves.
+_resumeFrom = None                          # Snapshot of the pending moves by stop(): (head, count)
+
+_dutyT1     = 0                             # T1 duty: _factor * initial duty, calculated by setFactor()
+_pulseOn    = 0                             # T0 "PWM" state for the preallocated timer callbacks:
+_pulseOff   = 0                             #   the pin to switch on and the pin to switch off by every pulse,
+_pulseTimer = _timerMotor[0]                #   the timer which ends the pulse,
+_pulseLength = 0                            #   the length of the pulse in ms (_config[0][1] or a ramp step).
+
+_modes      = [0, 0]                        # The current modes of the motors by _setController(): [left, right]
+_direction  = 0                             # The direction of the current move.
+_byTicks    = 0                             # 8, if the current move ends by encoder ticks (isTicks), otherwise 0.
+_rampSteps  = 0                             # Acceleration ramp: 0 - off, otherwise the count of its steps.
+_rampPeriod = 0                             # The length of a ramp step in ms.
+_rampT1     = array("H", [0])               # T1 duty by ramp steps: _rampT1[_rampSteps] is the full duty.
+_rampT0     = array("H", [0])               # T0 duty or pulse length (timer mode) by ramp steps.
+_rampIndex  = 0                             # The current step of the ramp.
+_blended    = False                         # True, if the next move continues the current one without ramp.
+_coalescing = False                         # Adjacent moves in the same direction run as one, without stop and breath.
+
+_tickSource   = None                        # Function returning the encoder counts: [T0, T1] (e.g. ubot_feedback.get)
+_tickTimeout  = 0                           # Safety net of the tick-target moves: ms per tick.
+_tickPeriod   = 10                          # The counts are checked in every _tickPeriod ms.
+_tickStart    = 0                           # Sum of the counts at the start of the current tick-target move.
+_tickTarget   = 0                           # The sum of the counts to reach: ticks per wheel * 2
+_tickDeadline = 0                           # ticks_ms, the timeout of the current tick-target move.
+_tickTimeouts = 0                           # Count of the tick-target moves ended by timeout.
+
+_allocMark  = 0                             # Allocation counter: gc.mem_alloc() at the start of the current move,
+_allocStart = 0                             #   ticks_ms at the start of the current move,
+_allocBytes = 0                             #   allocated bytes
+_allocTime  = 0                             #   while driving for this many ms.
+
 
 
 ################################
@@ -54,10 +98,12 @@ _callbacks  = [(), ()]
 
 def config(motorPins, motorConfig):
     global _active
+    global _pins
     global _pin
     global _pwm
 
     _active = (0 not in motorPins[0], 0 not in motorPins[1])
+    _pins   = motorPins
 
     _pin = (
         (Pin(motorPins[0][0], Pin.OUT), Pin(motorPins[0][1], Pin.OUT)) if _active[0] else (0, 0),
@@ -76,8 +122,13 @@ def config(motorPins, motorConfig):
 def configMotor(motorConfig):
     global _config
     global _breath
+    global _rampSteps
+    global _rampPeriod
+    global _rampT1
+    global _rampT0
+    global _rampIndex
     """
-    Parameter motorConfig consists of three tuples: T0 timer setting, T1 PWM setting, T1 duty factor and borders.
+    Parameter motorConfig consists of three tuples: T0 setting, T1 PWM setting, T1 duty factor and borders.
     The third of the three tuple is modified:
         - The T1 duty factor extracted into a "dedicated" variable (_factor) by setFactor().
         - From the given minimum duty and initial duty calculates the minimum duty factor (_config[2][0]).
@@ -86,18 +137,22 @@ def configMotor(motorConfig):
 
     The starting point (motorConfig):
 
-          T0 - RIGHT MOTOR |     T1 - LEFT MOTOR - PWM (and finetuning)      | Pause length  |
-          Timer based ctrl | PWM setting |          Fine tuning settings     | between moves |
-            (~freq, ~duty) |             |                                   |               |
-        ((period, duration), (freq, duty), (duty factor, min. duty, max. duty), breath length)
+          T0 - RIGHT MOTOR       |     T1 - LEFT MOTOR - PWM (and finetuning)      | Pause length  | Acceleration ramp |
+          Timer based ctrl, PWM  | PWM setting |          Fine tuning settings     | between moves |                   |
+            (~freq, ~duty), duty |             |                                   |               |                   |
+        ((period, duration, duty), (freq, duty), (duty factor, min. duty, max. duty), breath length, (length, step))
 
 
     The result (_config):
 
-          T0 - RIGHT MOTOR |     T1 - LEFT MOTOR - PWM (and finetuning)       |
-          Timer based ctrl | PWM setting |          Fine tuning settings      |
-            (~freq, ~duty) |             |                                    |
-        ((period, duration), (freq, duty), (min. duty factor, max. duty factor))
+          T0 - RIGHT MOTOR       |     T1 - LEFT MOTOR - PWM (and finetuning)       |
+          Timer based ctrl, PWM  | PWM setting |          Fine tuning settings      |
+            (~freq, ~duty), duty |             |                                    |
+        ((period, duration, duty), (freq, duty), (min. duty factor, max. duty factor))
+
+
+    If the T0 duty is above 0, the right motor is driven by machine.PWM with this duty instead of the timer.
+    (The PWM frequency of ESP8266 is common: T0 runs on the frequency of T1.)
     """
 
     _config = (
@@ -106,7 +161,20 @@ def configMotor(motorConfig):
         (motorConfig[2][1] / motorConfig[1][1], motorConfig[2][2] / motorConfig[1][1])
     )
 
+    """
+    The fifth element of the motorConfig is the acceleration ramp: the duties of its steps are precomputed.
+    It can be reconfigured during a move (subscription): the current step is clamped to the new table.
+    """
+    done        = _isRampDone()
+    ramp        = motorConfig[4] if 4 < len(motorConfig) else (0, 0)
+    _rampSteps  = ramp[0] // ramp[1] if 0 < ramp[1] else 0
+    _rampPeriod = ramp[1]
+    _rampT1     = array("H", [0] * (_rampSteps + 1))
+    _rampT0     = array("H", [0] * (_rampSteps + 1))
+    _rampIndex  = _rampSteps if done else min(_rampIndex, _rampSteps)
+
     setFactor(motorConfig[2][0])
+    _configT0()
 
     """ The fourth element of the motorConfig is _breath, the pause between movements. Use case: turtle mode """
     _breath = motorConfig[3]
@@ -118,8 +186,8 @@ def configMotor(motorConfig):
 
 def move(direction = 0, duration = 0):
     """
-    Public function which books a move tuple (direction, duration)
-    on _moveList for the indirect, future processing.
+    Public function which books a move (direction, duration)
+    on _moveQueue for the indirect, future processing.
 
     direction   : integer parameter
     0           : STOP
@@ -127,55 +195,118 @@ def move(direction = 0, duration = 0):
     2           : LEFT
     3           : RIGHT
     4           : BACKWARD
+    (5          : DRIVE, only by drive(): other directions are STOP)
 
     duration    : integer parameter (length of movement in millisecond)
+
+    Returns False if the move queue is full, so the move is not booked.
+
+    If the acceleration ramp is on, the move starts with ramping up and it is followed by ramping down,
+    so it lasts duration + ramp length, but the distance is the same as in duration at full speed.
+    (The ramp up misses as much distance as the ramp down adds.) Back-to-back moves in the same direction
+    are blended: there is no ramp between them, if there is no breath or coalescing is on: setCoalescing()
     """
-    _moveList.append((direction, duration))
-    _startProcessing()
+    if not 0 < direction < 5:           # Unknown directions stop, like before DRIVE. (DRIVE needs speeds.)
+        direction = 0
+
+    if _push(direction, duration, 0):
+        _startProcessing()
+        return True
+
+    return False
+
+
+def drive(leftSpeed = 0, rightSpeed = 0, duration = 0):
+    """
+    Public function which books a move with arbitrary wheel speeds (differential drive) for the given duration.
+    Use case: arcs, gentle corrections, joystick.
+
+    leftSpeed, rightSpeed : integer parameters, signed percentage of the full speed (-100 ... 100), negative: backward
+
+    A non-zero speed is mapped into the range from the minimum duty (T1MinDuty, the motors stall below it)
+    to the full duty: T1 by its PWM duty, T0 by its PWM duty in PWM mode, by its pulse length in timer mode
+    (so in timer mode its resolution is coarse: 1 ms). T0 uses the minimum duty ratio of T1.
+    There is no ramp and no speed control in DRIVE moves.
+    Consecutive DRIVE moves are blended if coalescing is on, so the speeds change without stopping.
+
+    Returns False if the move queue is full, so the move is not booked.
+    """
+    leftSpeed  = max(-100, min(100, leftSpeed))
+    rightSpeed = max(-100, min(100, rightSpeed))
+
+    if _push(5, duration, 0, (leftSpeed + 100) << 8 | (rightSpeed + 100)):
+        _startProcessing()
+        return True
+
+    return False
+
+
+def moveTicks(direction = 0, ticks = 0):
+    """
+    Like move(), but the move ends when the wheels have turned the given count of encoder ticks (on average),
+    or after ticks * tick timeout ms as a safety net. Needs a tick source: setTickSource()
+
+    Returns False if there is no tick source or the move queue is full, so the move is not booked.
+    """
+    if _tickSource != None and direction != 0 and _push(direction, ticks, 8):
+        _startProcessing()
+        return True
+
+    return False
 
 
 def stop():
-    global _moveList
-    global _resumeList
+    global _moveCount
+    global _resumeFrom
     """
-    "Copy" pending move tuples to _resumeList and
-    "clears" the _moveList, so pending move tuples
-    will not be processed (now).
+    Saves the position of the pending moves (head, count) to _resumeFrom and
+    "clears" the _moveQueue, so pending moves will not be processed (now).
     """
     _stopProcessing()
-    _resumeList = _moveList
-    _moveList   = []                # Reassign instead of clear() method!
+    _resumeFrom = (_moveHead, _moveCount)
+    _moveCount  = 0
 
 
 def resume():
-    global _moveList
-    global _resumeList
+    global _moveHead
+    global _moveCount
+    global _resumeFrom
     """
-    "Copy" back move tuples to _moveList from _resumeList,
-    "clears" the _resumeList, and start the processing.
+    Restores the pending moves saved by stop(), "clears" the snapshot, and start the processing.
+    (A move() after stop() discards the snapshot, its slots may be overwritten.)
     """
-    if not _processing:
-        _moveList   = _resumeList
-        _resumeList = []            # Reassign instead of clear() method!
+    if not _processing and _resumeFrom != None:
+        _moveHead, _moveCount = _resumeFrom
+        _resumeFrom = None
         _startProcessing()
 
 
 def setFactor(factor = 1):
     global _factor
+    global _dutyT1
     """
     Public function which set the T1 duty factor (_factor).
     This affects the left motor (T1) directly as you can see in _setController().
-    The purpose of this funtion the on-the-fly correction.
-    """
-    if factor < _config[2][0]:         # If parameter is less than the minimum duty factor:
-        _factor = _config[2][0]        #   - set the minimum duty f. as current duty f.
-        return _config[2][0] - factor  #   - return the difference (as a negative number)
-    elif _config[2][1] < factor:       # If the parameter is more than the maximum duty factor:
-        _factor = _config[2][1]        #   - set the maximum duty f. as current duty f.
-        return factor - _config[2][1]  #   - return the difference (as a positive number)
+    The purpose of this funtion the on-the-fly correction: the new duty is applied to the running move too,
+    unless it is a DRIVE move or the ramp is running (it reaches the new duty by its last step).
+    """
+    if factor < _config[2][0]:            # If parameter is less than the minimum duty factor:
+        _factor = _config[2][0]           #   - set the minimum duty f. as current duty f.
+        result  = _config[2][0] - factor  #   - return the difference (as a negative number)
+    elif _config[2][1] < factor:          # If the parameter is more than the maximum duty factor:
+        _factor = _config[2][1]           #   - set the maximum duty f. as current duty f.
+        result  = factor - _config[2][1]  #   - return the difference (as a positive number)
     else:
         _factor = factor
-        return 0
+        result  = 0
+
+    _dutyT1 = round(_factor * _config[1][1])    # Duty factor * initial duty (once, not by every move)
+    _fillRamp(_rampT1, _dutyT1)
+
+    if _modes[0] != 0 and _direction != 5 and _isRampDone():
+        _pwm[_modes[0] - 1].duty(_dutyT1)
+
+    return result
 
 
 def setCallback(slot, callbackFunction, isTemporary = False):
@@ -184,9 +315,9 @@ def setCallback(slot, callbackFunction, isTemporary = False):
     Setter for callbacks.
 
     slot : integer parameter
-    0    : After processing every item on _moveList, _stopAndNext() will call this.
+    0    : After processing every item on _moveQueue, _stopAndNext() will call this.
     1    : After every processed
-    2    : backward    After processing every item on _moveList,
+    2    : backward    After processing every item on _moveQueue,
     _stopAndNext() will call _callbacks[0]. Use case: Beeps or other function
     after movements. If isTemporary is True, _stopAndNext() delete
     this after execution.
@@ -200,6 +331,28 @@ def deleteCallback(slot = 0):
     _callbacks[slot] = ()
 
 
+def setTickSource(tickFunction, tickTimeout):
+    global _tickSource
+    global _tickTimeout
+    """ Sets the source of the encoder counts for moveTicks(): tickFunction() -> [T0 count, T1 count], and the timeout per tick in ms. """
+    _tickSource  = tickFunction
+    _tickTimeout = tickTimeout
+
+
+def getTickTimeouts():
+    """ Returns the count of the tick-target moves which have been ended by the timeout instead of the encoder ticks. """
+    return _tickTimeouts
+
+
+def setCoalescing(isCoalescing):
+    global _coalescing
+    """
+    Setter method for _coalescing. If it is True, adjacent moves in the same direction are merged
+    into one continuous run: no stop and no breath between them, but the step callback is called at every boundary.
+    """
+    _coalescing = isCoalescing
+
+
 def setBreath(breathLength):
     global _breath
     """ Setter method for _breath that is the pause in ms between movements. Use case: turtle mode """
@@ -210,19 +363,67 @@ def isProcessing():
     return _processing
 
 
+def getQueueLength():
+    """ Returns the count of the pending moves (the current one is not included). """
+    return _moveCount
+
+
+def getQueueCapacity():
+    return _queueSize
+
+
+def getFactor():
+    return _factor
+
+
+def isDriving():
+    """ Returns True, if both motors are driven at the same (full) speed at the moment. (Not in DRIVE moves and ramps.) """
+    return _modes[0] != 0 and _modes[1] != 0 and _direction != 5 and _isRampDone()
+
+
+def getAllocationRate():
+    """ Returns the allocated bytes per second while driving, measured by gc.mem_alloc() from the start to the end of the moves. """
+    return _allocBytes * 1000 // _allocTime if 0 < _allocTime else 0
+
+
 
 ################################
 ## PRIVATE, HELPER METHODS
 
+def _push(direction, amount, isTicks = 0, speeds = 0):  # isTicks: 0 - amount is a duration in ms, 8 - amount is ticks
+    global _moveCount
+
+    if _moveCount == _queueSize or not 0 <= direction <= 5 or not 0 <= amount < 0x10000000:
+        return False                    # Full, or the move can not be packed (e.g. direction 8 would set isTicks).
+
+    slot = (_moveHead + _moveCount) & _queueMask
+    _moveQueue[slot]  = amount << 4 | isTicks | direction
+    _speedQueue[slot] = speeds
+    _moveCount += 1
+    return True
+
+
+def _pop():
+    global _moveHead
+    global _moveSlot
+    global _moveCount
+
+    _moveSlot  = _moveHead
+    move       = _moveQueue[_moveHead]
+    _moveHead  = (_moveHead + 1) & _queueMask
+    _moveCount -= 1
+    return move
+
+
 def _startProcessing():
     global _processing
+    global _resumeFrom
 
-    if 0 < len(_resumeList):
-        _resumeList.clear()
+    _resumeFrom = None
 
-    if not _processing and 0 < len(_moveList):
+    if not _processing and 0 < _moveCount:
         _processing = True
-        _processMove(_moveList.pop(0))
+        _processMove(_pop())
 
 
 def _stopProcessing():
@@ -231,39 +432,190 @@ def _stopProcessing():
     _processing = False
 
 
-def _processMove(move):       # ((direction, duration))
+def _processMove(move):       # amount << 4 | isTicks << 3 | direction
     """
     Part of a recursive loop: _processMove(move) - _stopAndInitNext() - _processNext() - _processMove(move) ...
 
-    Sets the motors by _setController() according to the 'move' tuple: (direction, duration)
-    After that it initialise a timer to terminate this move, and to continue processing _moveList.
-    """
-    if move[0] == 1:                # FORWARD
-        _setController(1, 1)
-    elif move[0] == 2:              # LEFT
-        _setController(2, 1)
-    elif move[0] == 3:              # RIGHT
-        _setController(1, 2)
-    elif move[0] == 4:              # BACKWARD
-        _setController(2, 2)
-    else:                           # STOP
-        _setController(0, 0)
-
-
-    _timer.init(                    # STOP AND NEXT
-        period = move[1],
-        mode = Timer.ONE_SHOT,
-        callback = _stopAndInitNext
-    )
+    Sets the motors by _setController() according to the packed move: amount << 4 | isTicks << 3 | direction
+    After that it initialise a timer to terminate this move (after its duration, or by checking its ticks),
+    and to continue processing _moveQueue.
+    A move continuing the previous one (blended) keeps the motors running: the previous move missed its ramp down,
+    but this one has no ramp up, so the distance is the same.
+    """
+    global _direction
+    global _byTicks
+    global _blended
+
+    direction = move & 7
+    _byTicks  = move & 8
+
+    if not _blended:
+        _direction = direction
+
+        if direction == 1:          # FORWARD
+            _setController(1, 1)
+        elif direction == 2:        # LEFT
+            _setController(2, 1)
+        elif direction == 3:        # RIGHT
+            _setController(1, 2)
+        elif direction == 4:        # BACKWARD
+            _setController(2, 2)
+        elif direction != 5:        # STOP
+            _setController(0, 0)
+
+        if 0 < _rampSteps and direction != 0 and direction != 5:
+            _startRamp(1, _rampUp)
+
+    if direction == 5:              # DRIVE (blended too: only the speeds change)
+        _setSpeeds(_speedQueue[_moveSlot])
+
+    _blended = False
+    _markAllocation()
+
+    if move & 8:
+        _startTicks(move >> 4)
+    else:
+        _timer.init(                # STOP AND NEXT (after ramping down)
+            period = move >> 4,
+            mode = Timer.ONE_SHOT,
+            callback = _endMove
+        )
+
+
+def _startTicks(ticks):
+    global _tickStart
+    global _tickTarget
+    global _tickDeadline
+
+    counts        = _tickSource()
+    _tickStart    = counts[0] + counts[1]
+    _tickTarget   = ticks * 2
+    _tickDeadline = ticks_add(ticks_ms(), ticks * _tickTimeout)
 
+    _timer.init(period = _tickPeriod, mode = Timer.PERIODIC, callback = _checkTicks)
 
-def _stopAndInitNext(timer):
+
+def _checkTicks(timer):
+    global _tickTimeouts
+    """ Periodic callback of a tick-target move: ends the move if the target or the timeout is reached. """
+    counts = _tickSource()
+
+    if _tickTarget <= counts[0] + counts[1] - _tickStart:
+        _timer.deinit()
+        _endMove(timer)
+    elif 0 <= ticks_diff(ticks_ms(), _tickDeadline):
+        _tickTimeouts += 1
+        _timer.deinit()
+        _endMove(timer)
+
+
+def _endMove(timer):
+    """
+    Part of a recursive loop: _processMove(move) - _endMove() - _stopAndInitNext() - _processNext() - _processMove(move) ...
+
+    If the next move continues this one (same direction) and coalescing is on (or the ramp is on without breath),
+    they are blended: the next move starts without stopping, ramp and breath, then the step callback is called.
+    Otherwise the move stops immediately, or with ramp the motors ramp down before stopping.
+    (Moves by ticks stop immediately: they have reached their distance, a ramp down would overshoot it.)
+    """
+    global _blended
+
+    if (
+            (_coalescing or (0 < _rampSteps and _breath == 0))
+            and _direction != 0 and _processing and 0 < _moveCount and _moveQueue[_moveHead] & 7 == _direction
+    ):
+        _blended = True
+        _countAllocation()
+        _processNext()              # First the next move, so the callback (e.g. a step signal) does not delay it.
+        _callCallback(1)
+    elif _rampSteps == 0 or _direction == 0 or _direction == 5 or _byTicks:
+        _stopAndInitNext()
+    else:
+        _startRamp(min(_rampIndex, _rampSteps - 1), _rampDown)
+
+
+def _isRampDone():
+    """ Returns True, if the ramp is off, or the current move has reached its full duty (it is not ramping). """
+    return _rampSteps == 0 or _rampIndex == _rampSteps
+
+
+def _startRamp(index, callback):
+    global _rampIndex
+
+    _rampIndex = index
+    _applyRamp(index)
+    _rampTimer.init(period = _rampPeriod, mode = Timer.PERIODIC, callback = callback)
+
+
+def _rampUp(timer):
+    global _rampIndex
+
+    _rampIndex = min(_rampIndex + 1, _rampSteps)            # The ramp may have been shortened by configMotor().
+    _applyRamp(_rampIndex)
+
+    if _rampIndex == _rampSteps:
+        _rampTimer.deinit()
+
+
+def _rampDown(timer):
+    global _rampIndex
+
+    _rampIndex -= 1
+
+    if _rampIndex < 0:
+        _rampTimer.deinit()
+        _stopAndInitNext()
+    else:
+        _applyRamp(_rampIndex)
+
+
+def _setSpeeds(speeds):
+    global _pulseLength
+    """ Sets the motors according to the packed speeds of a DRIVE move: (left + 100) << 8 | (right + 100) """
+    left  = (speeds >> 8) - 100
+    right = (speeds & 255) - 100
+
+    _setController(0, 0)
+    _setController(0 if left == 0 else 1 if 0 < left else 2, 0 if right == 0 else 1 if 0 < right else 2)
+
+    if _modes[0] != 0:
+        _pwm[_modes[0] - 1].duty(_scaleDuty(_dutyT1, abs(left)))
+
+    if _modes[1] != 0:
+        if _pwmT0 != 0:
+            _pwmT0[_modes[1] - 1].duty(_scaleDuty(_config[0][2], abs(right)))
+        else:
+            _pulseLength = _scaleDuty(_config[0][1], abs(right))
+
+
+def _scaleDuty(full, speed):
+    """ Maps the speed (1 ... 100 %) into [minimum duty, full duty]. The minimum is given by the T1 min. duty factor. """
+    low = int(full * _config[2][0])
+    return low + (full - low) * speed // 100
+
+
+def _applyRamp(index):
+    global _pulseLength
+    """ Sets the duty (T0 in timer mode: the pulse length) of the running motors to the given step of the ramp. """
+    if _modes[0] != 0:
+        _pwm[_modes[0] - 1].duty(_rampT1[index])
+
+    if _modes[1] != 0:
+        if _pwmT0 != 0:
+            _pwmT0[_modes[1] - 1].duty(_rampT0[index])
+        else:
+            _pulseLength = _rampT0[index]
+
+
+def _stopAndInitNext(timer = None):
     """
     Part of a recursive loop: _processMove(move) - _stopAndInitNext() - _processNext() - _processMove(move) ...
 
     Stops the current, done task (movement), calls the callback and indirectly calls _processNext() (after a while).
     """
+    _rampTimer.deinit()
     _setController(0, 0)
+    _countAllocation()
     _callCallback(1)
 
     if 0 == _breath:
@@ -283,13 +635,36 @@ def _processNext(timer = None):
     Checks if processing is active and there is any task waiting for processing.
     If it finds task(s), pops the first and call _processMove(move). If not, loop stops.
     """
-    if _processing and 0 < len(_moveList):
-        _processMove(_moveList.pop(0))
+    if _processing and 0 < _moveCount:
+        _processMove(_pop())
     else:
         _stopProcessing()
         _callCallback(0)
 
 
+def _markAllocation():
+    global _allocMark
+    global _allocStart
+
+    _allocMark  = gc.mem_alloc()
+    _allocStart = ticks_ms()
+
+
+def _countAllocation():
+    global _allocBytes
+    global _allocTime
+
+    allocated = gc.mem_alloc() - _allocMark
+
+    if 0 <= allocated:                  # Negative: there was a garbage collection, the move is not counted.
+        _allocBytes += allocated
+        _allocTime  += ticks_diff(ticks_ms(), _allocStart)
+
+        if 60000 < _allocTime:          # Keeps the counters small (no long int): the older moves weigh less.
+            _allocBytes //= 2
+            _allocTime  //= 2
+
+
 def _callCallback(slot = 1):
     global _callbacks
     """ Helper method for calling and managing callbacks. """
@@ -301,6 +676,7 @@ def _callCallback(slot = 1):
 
 
 def _setController(modeLeft = 0, modeRight = 0):        # ! (T1 mode, T0 mode) ! because of clarity: (left, right)
+    global _pulseLength
     """
     Sets both motor in one go. (If both are active.)
     This setter is permanent,
@@ -312,27 +688,85 @@ def _setController(modeLeft = 0, modeRight = 0):        # ! (T1 mode, T0 mode) !
     2    : backward
     """
 
+    _modes[0] = modeLeft if _active[1] else 0
+    _modes[1] = modeRight if _active[0] else 0
+
     if _active[1]:                                      # T1 - LEFT MOTOR - PWM
         if modeLeft == 0:
             _pwm[0].duty(0)
             _pwm[1].duty(0)
         else:
-            duty = round(_factor * _config[1][1])       # Duty factor * initial duty
             _pwm[modeLeft - 1].freq(_config[1][0])
-            _pwm[modeLeft - 1].duty(duty)
+            _pwm[modeLeft - 1].duty(_dutyT1)
+
+    if _active[0] and _pwmT0 != 0:                      # T0 - RIGHT MOTOR - PWM
+        if modeRight == 0:
+            _pwmT0[0].duty(0)
+            _pwmT0[1].duty(0)
+        else:
+            _pwmT0[modeRight - 1].duty(_config[0][2])
 
-    if _active[0]:                                      # T0 - RIGHT MOTOR - Timer "PWM"
+    elif _active[0]:                                    # T0 - RIGHT MOTOR - Timer "PWM"
         if modeRight == 0:
             _timerT1.deinit()
             _driveMotor(0, 0)
         else:
+            _setPulse(modeRight)
+            _pulseLength = _config[0][1]
             _timerT1.init(
                 period = _config[0][0],
                 mode = Timer.PERIODIC,
-                callback = lambda t:_driveMotor(0, modeRight, _config[0][1])
+                callback = _startPulse
             )
 
 
+def _fillRamp(table, duty):
+    """ Fills the ramp table in place (no allocation): the duties of the steps grow linearly to the full duty. """
+    for i in range(_rampSteps + 1):
+        table[i] = duty * i // _rampSteps if 0 < _rampSteps else duty
+
+
+def _configT0():
+    global _pin
+    global _pwmT0
+    global _pulseLength
+    """ Switches the right motor (T0) between the PWM and the timer mode according to the T0 duty. """
+    if not _active[0]:
+        return
+
+    if 0 < _config[0][2] and _pwmT0 == 0:
+        _timerT1.deinit()
+        _pwmT0 = (PWM(Pin(_pins[0][0]), _config[1][0], 0), PWM(Pin(_pins[0][1]), _config[1][0], 0))
+    elif _config[0][2] == 0 and _pwmT0 != 0:
+        _pwmT0[0].deinit()
+        _pwmT0[1].deinit()
+        _pwmT0 = 0
+        _pin   = ((Pin(_pins[0][0], Pin.OUT), Pin(_pins[0][1], Pin.OUT)), _pin[1])
+        _driveMotor(0, 0)
+
+    _pulseLength = _config[0][1]
+    _fillRamp(_rampT0, _config[0][2] if _pwmT0 != 0 else _config[0][1])
+
+
+def _setPulse(mode):
+    global _pulseOn
+    global _pulseOff
+    """ Prepares the state of the T0 "PWM" callbacks, so they do not allocate (no closure, no argument). """
+    _pulseOn  = _pin[0][1 - mode]
+    _pulseOff = _pin[0][abs(mode - 2)]
+
+
+def _startPulse(timer):
+    """ Periodic callback of _timerT1: switches on the T0 (right) motor for _pulseLength ms. """
+    if 0 < _pulseLength:
+        _pulseOn.on()
+        _pulseOff.off()
+        _pulseTimer.init(period = _pulseLength, mode = Timer.ONE_SHOT, callback = _endPulse)
+
+
+def _endPulse(timer):
+    _pulseOn.off()
+
 
 def _driveMotor(motor = 0, mode = 0, duration = 0):
     """
@@ -357,8 +791,16 @@ def _driveMotor(motor = 0, mode = 0, duration = 0):
             _timerMotor[motor].init(
                 period = duration,
                 mode = Timer.ONE_SHOT,
-                callback = lambda t:_driveMotor(motor, 0)
+                callback = _stopMotorT0 if motor == 0 else _stopMotorT1
             )
         else:
             _pin[motor][0].off()
             _pin[motor][1].off()
+
+
+def _stopMotorT0(timer):
+    _driveMotor(0, 0)
+
+
+def _stopMotorT1(timer):
+    _driveMotor(1, 0)
@@ -29,9 +29,11 @@
     SOFTWARE.
 """
 
-import gc, uos
+import gc, uos, usys
 
 import ubot_config as config
+import ubot_logger as logger
+import ubot_motor  as motor
 import ubot_turtle as turtle
 
 
@@ -195,10 +197,33 @@ def getDebugPanel():
               "                <tr><td> <strong>Firmware:</strong> </td><td> {firmware} </td><td><a href='license'>MIT License</a></td></tr>\n"
               "                <tr><td> <strong>Free memory:</strong> </td><td> {freeMemory}% </td><td> {memoryDetails} </td></tr>\n"
               "                <tr><td> <strong>Free space:</strong> </td><td> {freeSpace}% </td><td> {diskDetails} </td></tr>\n"
+              "                <tr><td> <strong>Allocation:</strong> </td><td> {allocationRate:,} B/s </td><td> while driving </td></tr>\n"
+              "{wheelControl}"
               "                <tr><td> <strong>System RTC:</strong> </td><td colspan='2'> {year}. {month:02d}. {day:02d}.&nbsp;&nbsp;&nbsp;{hour:02d} : {minute:02d} : {second:02d} </td></tr>\n"
               "            </table>\n"
+              "        <br><br><hr><hr>\n"
+              "        <h3>Log budget</h3>\n"
+              "            <table class='system'>\n"
+              "{logBudget}"
+              "            </table>\n"
              )
 
+    logBudget = ""
+    for usage in logger.getUsage():                                      # (directory, bytes, boots, max. bytes, max. boots)
+        logBudget += ("                <tr><td> <strong>{}</strong> </td><td> {}% </td>"
+                      "<td> {:,} / {:,} B &nbsp; {} / {} boots </td></tr>\n").format(
+            usage[0], max(usage[1] * 100 // usage[3], usage[2] * 100 // usage[4]), usage[1], usage[3], usage[2], usage[4]
+        )
+
+    wheelControl = ""
+    feedback     = usys.modules.get("ubot_feedback")
+    if feedback != None:                                                 # (samples, mean error, max. error, last error, factor)
+        stats = feedback.getControlStats()
+        wheelControl = ("                <tr><td> <strong>Wheel control:</strong> </td><td> {:.2f} </td>"
+                        "<td> error (ticks): mean {:.2f}, max. {}, last {} &nbsp; samples: {} </td></tr>\n").format(
+            stats[4], stats[1], stats[2], stats[3], stats[0]
+        )
+
     firmware = config.get("system", "firmware")
     firmwareVersion = "{}.{}.{}".format(
         firmware[0], firmware[1], firmware[2]
@@ -221,8 +246,10 @@ def getDebugPanel():
         firmware = firmwareVersion,
         freeMemory = freePercent, memoryDetails = memoryDetails,
         freeSpace = freeSpace, diskDetails = diskDetails,
+        allocationRate = motor.getAllocationRate(), wheelControl = wheelControl,
         year = dt[0], month = dt[1], day = dt[2],
-        hour = dt[4], minute = dt[5], second = dt[6]
+        hour = dt[4], minute = dt[5], second = dt[6],
+        logBudget = logBudget
     )
 
 
@@ -31,6 +31,7 @@
 
 import ujson, uos
 
+from array   import array
 from machine import Pin, Timer
 
 import ubot_config as config
@@ -39,6 +40,8 @@ import ubot_logger as logger
 import ubot_motor  as motor
 
 
+_turtleConfig = config.getModule("turtle")                  # One read for every turtle setting.
+
 _powerOnCount = config.get("system", "powerOnCount")
 _fileName     = "{:010d}.txt".format(_powerOnCount)
 _savedCount   = 0
@@ -50,22 +53,25 @@ _inputPin = Pin(16, Pin.OUT)                                # FUTURE: _inputPin
 _inputPin.off()                                             # DEPRECATED: New PCB design (2.1) will resolve this.
 _inputPin.init(Pin.IN)                                      # DEPRECATED: New PCB design (2.1) will resolve this.
 
-_checkPeriod  = config.get("turtle", "checkPeriod")
+_checkPeriod  = _turtleConfig.get("checkPeriod")
 _counterPosition = 0                                        # The position of the decade counter (U3).
 
-_pressLength  = config.get("turtle", "pressLength")
-_maxError     = config.get("turtle", "maxError")
+_pressLength  = _turtleConfig.get("pressLength")
+_maxError     = _turtleConfig.get("maxError")
 _lastPressed  = [0, 0]                                      # Inside: [last pressed button, elapsed (button check) cycles]
-_firstRepeat  = config.get("turtle", "firstRepeat")
+_firstRepeat  = _turtleConfig.get("firstRepeat")
 
-_loopChecking = config.get("turtle", "loopChecking")
+_loopChecking = _turtleConfig.get("loopChecking")
 
-_moveLength   = config.get("turtle", "moveLength")
-_turnLength   = config.get("turtle", "turnLength")
-_breathLength = config.get("turtle", "breathLength")
+_moveLength   = _turtleConfig.get("moveLength")
+_moveTicks    = _turtleConfig.get("moveTicks", 0)           # If it is set, "F" and "B" end on encoder ticks: motor.moveTicks()
+_turnLength   = _turtleConfig.get("turnLength")
+_breathLength = _turtleConfig.get("breathLength")
 
-_endSignal    = config.get("turtle", "endSignal")           # Sound indicates the end of a step during execution: buzzer.keyBeep(_stepSignal)
-_stepSignal   = config.get("turtle", "stepSignal")          # Sound indicates the end of program execution:       buzzer.keyBeep(_endSignal)
+_endSignal    = _turtleConfig.get("endSignal")              # Sound indicates the end of a step during execution: buzzer.keyBeep(_stepSignal)
+_stepSignal   = _turtleConfig.get("stepSignal")             # Sound indicates the end of program execution:       buzzer.keyBeep(_endSignal)
+_stepTiming   = _turtleConfig.get("stepTiming", "overlapped")   # "strict": the step signal ends before the breath / next move,
+                                                                # "overlapped": it plays in the background during them.
 
 _pressedListIndex = 0
 _pressedList  = [0] * (_pressLength + _maxError)            # Low-level:  The last N (_pressLength + _maxError) buttoncheck results.
@@ -90,28 +96,50 @@ _timer             = Timer(-1)                              # Executes the repea
 
 _blockBoundaries   = ((40, 41), (123, 125), (126, 126))     # (("(", ")"), ("{", "}"), ("~", "~"))
 
+_moveCommands      = (70, 66, 76, 108, 82, 114, 80)         # "F", "B", "L", "l", "R", "r", "P": executed as move()
+_compiledKey       = None                                   # The compiled form of the last executed program:
+_compiledCode      = array("L")                             #   it is reused until the program (or a function) changes,
+_compiledEntry     = 0                                      #   the execution starts at this instruction.
+                                                            # Instructions: target << 11 | argument << 3 | opcode
+_opMove, _opLoop, _opEnd, _opCall, _opReturn, _opJump, _opHalt = range(7)
+
+_lookahead    = _turtleConfig.get("lookahead", 8)          # Streaming execution: moves booked ahead on the motor queue,
+_feedBudget   = _turtleConfig.get("feedBudget", 64)        #   max. instructions executed by one feed.
+_feedTimer    = Timer(-1)                                   # Continues the feeding, if the budget has run out.
+_code         = _compiledCode                               # The executed program: instructions,
+_codeIndex    = 0                                           #   the next instruction,
+_counters     = []                                          #   loop counters,
+_returns      = []                                          #   returning positions of the function calls.
+
+_tunables = ("checkPeriod", "pressLength", "maxError", "firstRepeat", "loopChecking",   # Settings which can be changed
+             "moveLength", "moveTicks", "turnLength", "breathLength",                   # without reboot: _callbackConfig()
+             "endSignal", "stepSignal", "stepTiming", "lookahead", "feedBudget")
+
 
 ################################
 ## PUBLIC METHODS
 
 def move(direction):
+    """ Books the move on the motor. Returns False if it is not booked (the move queue is full). """
     if isinstance(direction, str):
         direction = ord(direction)
 
     if direction == 70:                 # "F" - FORWARD
-        motor.move(1, _moveLength)
+        return _moveStraight(1)
     elif direction == 66:               # "B" - BACKWARD
-        motor.move(4, _moveLength)
+        return _moveStraight(4)
     elif direction == 76:               # "L" - LEFT (90°)
-        motor.move(2, _turnLength)
+        return motor.move(2, _turnLength)
     elif direction == 108:              # "l" - LEFT (45°)
-        motor.move(2, _turnLength // 2) #                       Placeholder...
+        return motor.drive(-50, 50, _turnLength)    #           Turning in place at half speed.
     elif direction == 82:               # "R" - RIGHT (90°)
-        motor.move(3, _turnLength)
+        return motor.move(3, _turnLength)
     elif direction == 114:              # "r" - RIGHT (45°)
-        motor.move(3, _turnLength // 2) #                       Placeholder...
+        return motor.drive(50, -50, _turnLength)    #           Turning in place at half speed.
     elif direction == 80:               # "P" - PAUSE
-        motor.move(0, _moveLength)
+        return motor.move(0, _moveLength)
+
+    return True
 
 
 def press(pressed):                     # pressed = 1<<buttonOrdinal
@@ -279,6 +307,7 @@ def _addCommand(pressed):
             result = 0                  # Not only lack of buttonpress (pressed == 0) returns 0.
         elif _runningProgram:
             motor.stop()                                                    # Stop commands / program execution.
+            _feedTimer.deinit()
             _processingProgram = False
             _runningProgram    = False
             result = _beepAndReturn(("processed", 0))                   # Beep and skip the (result) processing.
@@ -416,100 +445,177 @@ def _start(arguments):                # (blockLevel,)
         _upperBoundary = _programParts[-1]
 
     _pointer      =  _blockStartIndex + 1 if arguments[0] else 0
-    _pointerStack = []
-    _counterStack = []
 
     config.saveDateTime()
     _logExecuted()
 
-    motor.setCallback(0, _callbackEnd, True)      # Set as temporary, because not every execution need it.
-
-    #counter = 0                             #      Debug
-    #print("_toPlay[:_pointer]", "_toPlay[_pointer:]", "\t\t\t", "counter", "_pointer", "_toPlay[_pointer]") # Debug
-
-    while _processingProgram:
-        remaining = _upperBoundary - 1 - _pointer #      Remaining bytes in _toPlay bytearray. 0 if _toPlay[_pointer] == _toPlay[-1]
-        checkCounter = False
-
-        #if _pointer < _upperBoundary:          #      Debug
-        #    print(_toPlay[:_pointer].decode(), _toPlay[_pointer:].decode(), "\t\t\t", counter, _pointer, _toPlay[_pointer])
-
-        if remaining < 0:                       #      If everything is executed, exits.
-            _processingProgram = False
-
-
-        elif _toPlay[_pointer] == 40:           # "("  The block-level previews are excluded. (Those starts from first statement.)
-
-            _pointerStack.append(_pointer)      #      Save the position of the loop's starting parentheses: "("
-
-            while _pointer < _upperBoundary and _toPlay[_pointer] != 42: # "*"  Jump to the end of the loop's body.
-                _pointer += 1
-
-            remaining = _upperBoundary - 1 - _pointer
-
-            if 2 <= remaining and _toPlay[_pointer] == 42:       # If the loop is complete and the pointer is at the end of its body.
-                _counterStack.append(_toPlay[_pointer + 1] - 48) # Counter was increased at definition by 48. b'0' == 48
-                checkCounter = True
-            else:                               #      Maybe it's an error, so stop execution.
-                _processingProgram = False
-
-
-        elif _toPlay[_pointer] == 42:           # "*"  End of the body of the loop.
-            _counterStack[-1] -= 1              #      Decrease the loop counter.
-            checkCounter = True
-
-
-        elif _toPlay[_pointer] == 123:          # "{"  Start of a function.
-
-            while _pointer < _upperBoundary and _toPlay[_pointer] != 125: # "}" Jump to the function's closing curly brace.
-                _pointer += 1
-
-            if _toPlay[_pointer] != 125:        #      Means the _pointer < _upperBoundary breaks the while loop.
-                _processingProgram = False
-
-
-        elif _toPlay[_pointer] == 124:          # "|"  End of the currently executed function.
-            _pointer = _pointerStack.pop()      #      Jump back to where the function call occurred.
+    _startFeeding(_compile(_toPlay, _pointer, _upperBoundary), _compiledEntry)
 
-
-        elif _toPlay[_pointer] == 126:          # "~"
-            if 2 <= remaining and _toPlay[_pointer + 2] == 126: # Double-check: 1. Enough remaining to close function call; 2. "~"
-                _pointerStack.append(_pointer + 2)      # Save the returning position as the second tilde: "~"
-                _index = _toPlay[_pointer + 1] - 49     # Not 48! functionId - 1 = array index
-                _jumpTo = -1                            # Declared with -1 because of the check "_pointer != _jumpTo".
-                if _index < len(_functionPosition):     # If the _functionPosition contains the given function index.
-                    _jumpTo = _functionPosition[_index]
-                    if 0 <= _jumpTo:                    # If the retrieved value from _functionPosition is a real position.
-                        _pointer = _jumpTo
-                if _pointer != _jumpTo:                 # This handles both else branch of previous two if statements:
-                    del _pointerStack[-1]               # The function call failed, there is no need for "jump back" index.
-                    _pointer += 2                       # Jump to the second tilde: "~" (Skip the whole function call.)
-            else:                                       # Maybe it's an error, so stop execution.
-                _processingProgram = False
+    _startButtonChecking()
+    return 0
 
 
-        else:
-            move(_toPlay[_pointer])             #      Try to execute the command as move. It can fail without exception.
+def _compile(toPlay, start, upper):
+    """
+    Compiles the bytecode into a flat instruction array with resolved jump targets, loop counters and call targets.
+    Returns the cached one, if the bytecode and the function positions have not changed since the last compilation.
+    The whole [0, upper) range is compiled, so the functions defined before start can be called too.
+    The execution starts at _compiledEntry, the first instruction from start.
+
+        F, B, L, l, R, r, P    -> MOVE   (command)
+        ( [body] * [count] )   -> LOOP   (count, exit)  [body]  END (body start)
+        { [body] | [id] }      -> JUMP   (after RETURN) [body]  RETURN
+        ~ [id] ~               -> CALL   (body start of the function)
+
+    An incomplete block or function call becomes HALT: the execution stops there, like it did without compilation.
+    """
+    global _compiledKey
+    global _compiledCode
+    global _compiledEntry
+
+    key = (start, bytes(toPlay[:upper]), tuple(_functionPosition))
+
+    if key == _compiledKey:
+        return _compiledCode
+
+    code      = []
+    positions = {}                                          # Byte position -> instruction index
+    calls     = []                                          # (instruction index, function index)
+    blocks    = []                                          # Open "(" and "{": (byte, instruction index)
+    entry     = -1
+    pointer   = 0
+
+    while pointer < upper:
+        if entry < 0 and start <= pointer:
+            entry = len(code)
+
+        command = toPlay[pointer]
+        positions[pointer] = len(code)
+
+        if command == 40:                                   # "("  LOOP, patched at its "*"
+            blocks.append((40, len(code)))
+            code.append(_opHalt)
+
+        elif command == 42:                                 # "*"  END, the counter follows, then ")"
+            if upper <= pointer + 2 or len(blocks) == 0 or blocks[-1][0] != 40:
+                code.append(_opHalt)
+                break
+
+            loop = blocks.pop()[1]
+            code.append((loop + 1) << 11 | _opEnd)
+            code[loop] = len(code) << 11 | (toPlay[pointer + 1] - 48) << 3 | _opLoop
+            pointer += 2
+
+        elif command == 123:                                # "{"  JUMP over the definition, patched at its "|"
+            blocks.append((123, len(code)))
+            code.append(_opHalt)
+
+        elif command == 124:                                # "|"  RETURN, the function ID and "}" follows
+            code.append(_opReturn)
+
+            if 0 < len(blocks) and blocks[-1][0] == 123:
+                code[blocks.pop()[1]] = len(code) << 11 | _opJump
+                pointer += 2
+
+        elif command == 126:                                # "~"  CALL, patched after compilation
+            if upper <= pointer + 2 or toPlay[pointer + 2] != 126:
+                code.append(_opHalt)
+                break
+
+            calls.append((len(code), toPlay[pointer + 1] - 49))
+            code.append(_opHalt)
+            pointer += 2
+
+        elif command in _moveCommands:
+            code.append(command << 3 | _opMove)
+
+        pointer += 1
+
+    for call in calls:                                      # Undefined function or unreachable body: no call.
+        position = _functionPosition[call[1]] if 0 <= call[1] < len(_functionPosition) else -1
+        target   = positions.get(int(position) + 1, -1) if 0 <= position else -1
+        code[call[0]] = target << 11 | _opCall if 0 <= target else (call[0] + 1) << 11 | _opJump
+
+    _compiledKey   = key
+    _compiledCode  = array("L", code)                       # The open blocks stay HALT.
+    _compiledEntry = entry if 0 <= entry else len(code)     # Not reached (e.g. an incomplete block before): nothing runs.
+    return _compiledCode
+
+
+def _startFeeding(code, entry = 0):
+    global _code
+    global _codeIndex
+
+    _feedTimer.deinit()
+    _code      = code
+    _codeIndex = entry
+    _counters.clear()
+    _returns.clear()
+    _feed()
+
+
+def _feed(timer = None):
+    """
+    Streaming interpreter of the compiled program: executes instructions until the motor queue holds
+    _lookahead moves, so the memory use is constant whatever the loop counts are. It is called at start
+    and from the motor step callback. At most _feedBudget instructions are executed in one go (e.g. loops
+    without moves), then it continues by _feedTimer.
+    """
+    global _processingProgram
+    global _codeIndex
 
+    budget = _feedBudget
 
-        if checkCounter:
-            if 0 < _counterStack[-1]:           #      If the loop counter is greater than 0.
-                _pointer = _pointerStack[-1]    #      Jump back to the loop starting position.
+    while _processingProgram and motor.getQueueLength() < _lookahead:
+        if len(_code) <= _codeIndex:
+            _processingProgram = False
+            _finishFeeding()
+            return
+
+        if budget == 0:
+            _feedTimer.init(period = 1, mode = Timer.ONE_SHOT, callback = _feed)
+            return
+
+        budget     -= 1
+        instruction = _code[_codeIndex]
+        opcode      = instruction & 7
+        _codeIndex += 1
+
+        if opcode == _opMove:
+            if not move(instruction >> 3):                  # The motor queue is full (lookahead > its capacity):
+                _codeIndex -= 1                             #   the move is retried at the next step callback.
+                return
+        elif opcode == _opLoop:
+            if instruction >> 3 & 255 == 0:
+                _codeIndex = instruction >> 11
             else:
-                del _pointerStack[-1]           #      Delete the loop's starting position from stack.
-                del _counterStack[-1]           #      Delete the loop's counter from stack.
-                _pointer += 2                   #      Jump to the loop's closing parentheses: ")"
-
-        #if _pointer < _upperBoundary:           #      Debug
-        #    print(_toPlay[:_pointer].decode(), _toPlay[_pointer:].decode(), "\t\t\t", counter, _pointer, _toPlay[_pointer], "\n")
-        #counter += 1                            #      Debug
+                _counters.append(instruction >> 3 & 255)
+        elif opcode == _opEnd:
+            _counters[-1] -= 1
+            if 0 < _counters[-1]:
+                _codeIndex = instruction >> 11
+            else:
+                _counters.pop()
+        elif opcode == _opCall:
+            _returns.append(_codeIndex)
+            _codeIndex = instruction >> 11
+        elif opcode == _opReturn and 0 < len(_returns):
+            _codeIndex = _returns.pop()
+        elif opcode == _opJump:
+            _codeIndex = instruction >> 11
+        else:                                               # HALT (or RETURN without call)
+            _processingProgram = False
+            _finishFeeding()
 
-        _pointer += 1
 
-    _processingProgram = False
+def _finishFeeding():
+    """ Every move is booked: the end signal follows the last one. """
+    _feedTimer.deinit()
 
-    _startButtonChecking()
-    return 0
+    if motor.isProcessing():
+        motor.setCallback(0, _callbackEnd, True)            # Set as temporary, because not every execution need it.
+    else:
+        _callbackEnd()
 
 
 # COMMAND AND PROGRAM ARRAY
@@ -581,12 +687,14 @@ def _modifyLoopCounter(arguments):          # (value,)     Increasing by this va
 def _checkLoopCounter():
     global _loopChecking
 
+    blocking = 20 < _loopCounter                            # The tone queue holds ~25 beeps: more are played in place.
+
     if _loopChecking == 2 or (_loopChecking == 1 and _loopCounter <= 20):
-        buzzer.keyBeep("attention")
-        buzzer.midiBeep(64, 100, 500, _loopCounter)
+        buzzer.keyBeep("attention", blocking)
+        buzzer.midiBeep(64, 100, 500, _loopCounter, blocking)   # After "attention": queued, or played in place.
     else:
-        buzzer.keyBeep("tooLong")
-    buzzer.rest(1000)
+        buzzer.keyBeep("tooLong", blocking)
+    buzzer.rest(1000, blocking)
     return 0
 
 
@@ -711,11 +819,22 @@ def _customMapping():
 ## CALLBACK FUNCTIONS
 
 def _callbackStep():
+    if _processingProgram:                  # Refills the motor queue, while the program is streamed.
+        _feed()
+
     if _stepSignal != "":
-        buzzer.keyBeep(_stepSignal)
+        buzzer.keyBeep(_stepSignal, _stepTiming == "strict")
     checkButtons()
 
 
+def _moveStraight(direction):
+    """ Moves by encoder ticks if it is set and possible (there is feedback), otherwise by time. """
+    if _moveTicks != 0 and motor.moveTicks(direction, _moveTicks):
+        return True
+
+    return motor.move(direction, _moveLength)
+
+
 def _callbackEnd():
     global _runningProgram
 
@@ -725,6 +844,23 @@ def _callbackEnd():
         buzzer.keyBeep(_endSignal)
 
 
+def _callbackConfig(attribute, value):
+    """ Applies the new value of a turtle setting without reboot. (Subscribed in ubot_config.) """
+    global _pressedList
+    global _pressedListIndex
+
+    if attribute in _tunables:
+        globals()["_" + attribute] = value
+
+    if attribute == "checkPeriod":
+        _startButtonChecking()
+    elif attribute == "pressLength" or attribute == "maxError":
+        _pressedList      = [0] * (_pressLength + _maxError)
+        _pressedListIndex = 0
+    elif attribute == "breathLength":
+        motor.setBreath(value)
+
+
 
 ################################
 ## MAPPINGS
@@ -797,5 +933,6 @@ _functionMapping = {
 _currentMapping = _defaultMapping
 
 motor.setCallback(1, _callbackStep)
+config.subscribe("turtle", None, _callbackConfig)
 
 _startButtonChecking()
@@ -44,8 +44,7 @@ _connection    = 0
 _address       = 0
 
 _started       = False
-_period        = config.get("webServer", "period")
-_timeout       = config.get("webServer", "timeout")
+_period, _timeout = config.getMany("webServer", ("period", "timeout"))
 _timer         = Timer(-1)
 _socket        = usocket.socket(usocket.AF_INET, usocket.SOCK_STREAM)
 _poller        = uselect.poll()
@@ -93,6 +92,19 @@ def stop():
 ################################
 ## PRIVATE, HELPER METHODS
 
+def _callbackConfig(attribute, value):
+    """ Applies the new value of a web server setting without reboot. (Subscribed in ubot_config.) """
+    global _period
+    global _timeout
+
+    if attribute == "period":
+        _period = value
+        if _started:
+            _timer.init(period = _period, mode = Timer.PERIODIC, callback = _poll)
+    elif attribute == "timeout":
+        _timeout = value
+
+
 def _poll(timer):
     try:
         if not motor.isProcessing():
@@ -158,7 +170,11 @@ def _processIncoming(incoming):
 
 def _processGetQuery(path):
     try:
-        if path in template.title:
+        route, parameters = _parseQuery(path)
+
+        if route == "/log":
+            _sendLog(parameters)
+        elif path in template.title:
             _connection.write("HTTP/1.1 200 OK\r\n")
             _connection.write("Content-Type: text/html\r\n")
             _connection.write("Connection: close\r\n\r\n")
@@ -173,20 +189,33 @@ def _processGetQuery(path):
                 _connection.write(part())
 
             if path == "/debug":
+                logger.flush()                          # Shows the buffered items too.
                 logFiles = (
                     ("Exceptions",  "log/exception/"),
                     ("Events",      "log/event/"),
                     ("Objects",     "log/object/")
                 )
 
+                fileName = logger.getFileName()
+
                 for logFile in logFiles:
                     _connection.write("        <br><br><hr><hr>\n")
                     _connection.write("        <h3>{}</h3>\n".format(logFile[0]))
-                    _sendRaw("{}{:010d}.txt".format(logFile[1], config.get("system", "powerOnCount")))
+                    _connection.write("        <p><a href='/log?type={0}&last=60'>Last minute</a> &nbsp;| &nbsp; "
+                                      "<a href='/log?type={0}'>Whole boot</a></p>\n".format(logFile[1][4:-1]))
+                    if fileName[-4:] == ".bin":
+                        _connection.write(("        <p>Binary log: <a href='/raw/{0}{1}'>{0}{1}</a> "
+                                           "(decode it with tools/ubot_logdecoder.py)</p>\n").format(logFile[1], fileName))
+                    else:
+                        _sendRaw(logFile[1] + fileName)
                     _connection.write("        <br><hr><br>\n")
                     _sendRaw("{}0000000000.txt".format(logFile[1]))
 
             _connection.write(template.getPageFooter())
+        elif path[:5] == "/raw/" and path[-4:] == ".bin":
+            if path[:9] == "/raw/log/":
+                logger.flush()
+            _sendBinary(path[4:])
         elif path[:5] == "/raw/":
             _connection.write("HTTP/1.1 200 OK\r\n")
             _connection.write("Content-Type: text/html\r\n")
@@ -195,6 +224,8 @@ def _processGetQuery(path):
             _connection.write(template.getGeneralStyle())
             _connection.write(template.getRawStyle())
             _connection.write(template.getPageHeadEnd())
+            if path[:9] == "/raw/log/":
+                logger.flush()
             _sendRaw(path[4:])
             _connection.write(template.getPageFooter())
         else:
@@ -256,6 +287,68 @@ def _reply(returnFormat, httpCode, message):
         _connection.close()
 
 
+def _parseQuery(path):
+    """ "/log?type=event&last=60" -> ("/log", {"type": "event", "last": "60"}) """
+    parameters = {}
+    route, separator, query = path.partition("?")
+
+    for pair in query.split("&"):
+        key, separator, value = pair.partition("=")
+        if key != "":
+            parameters[key] = value
+
+    return route, parameters
+
+
+def _sendLog(parameters):
+    """
+    Sends the records of a log as plain text, filtered by the query parameters:
+
+    type : exception, event (default) or object
+    boot : power on count, default: the current boot
+    from : seconds since the boot, the beginning of the time range
+    to   : seconds since the boot, the end of the time range
+    last : seconds, only the last part of the boot (instead of 'from')
+    """
+    try:
+        logType   = parameters.get("type", "event")
+        boot      = int(parameters["boot"]) if "boot" in parameters else None
+        fromTicks = int(float(parameters["from"]) * 1000) if "from" in parameters else None
+        toTicks   = int(float(parameters["to"]) * 1000) if "to" in parameters else None
+        last      = float(parameters["last"]) if "last" in parameters else None
+
+        if logType not in ("exception", "event", "object"):
+            raise ValueError
+
+        records = logger.queryLog(logType, boot, fromTicks, toTicks, last)
+    except ValueError:
+        _reply("HTML", "400 Bad Request", "Parameters: type (exception, event, object), boot, from, to, last")
+        return
+
+    _connection.write("HTTP/1.1 200 OK\r\n")
+    _connection.write("Content-Type: text/plain; charset=utf-8\r\n")
+    _connection.write("Connection: close\r\n\r\n")
+
+    for line in records:
+        _connection.write(line)
+
+
+def _sendBinary(path):
+    """ Sends the file as it is, in chunks. """
+    try:
+        with open(path, "rb") as file:
+            _connection.write("HTTP/1.1 200 OK\r\n")
+            _connection.write("Content-Type: application/octet-stream\r\n")
+            _connection.write("Connection: close\r\n\r\n")
+
+            chunk = file.read(512)
+            while chunk:
+                _connection.write(chunk)
+                chunk = file.read(512)
+    except OSError:
+        _reply("HTML", "404 Not Found", "[Errno 2] ENOENT : No such file.")
+
+
 def _sendRaw(path):
     """ If the path links to a dir, sends a linked list, otherwise tries to send the content of the target entity. """
     try:
@@ -299,11 +392,22 @@ def _sendRaw(path):
         else:
             _connection.write("        <pre>\n")
             try:
-                with open(path) as file:
-                    for line in file:
+                if path[:4] == "log/" and path[-4:] == ".txt" and path != "log/datetime.txt":
+                    for line in logger.readLog(path):               # Log records: wall clock time instead of ticks.
                         _connection.write(line)
+                else:
+                    with open(path) as file:
+                        for line in file:
+                            _connection.write(line)
             except Exception:
                 _connection.write("[Errno 2] ENOENT : No such file.\n")
             _connection.write("        </pre>\n")
     except Exception:
         _connection.write("[Errno 2] ENOENT : No such file or directory.\n")
+
+
+
+################################
+## INITIALISATION
+
+config.subscribe("webServer", None, _callbackConfig)
@@ -0,0 +1,126 @@
+"""
+    uBot_firmware   // The firmware of the μBot, the educational floor robot. (A MicroPython port to ESP8266 with additional modules.)
+
+    This file is part of uBot_firmware.
+    [https://zza.hu/uBot_firmware]
+    [https://git.zza.hu/uBot_firmware]
+
+
+    MIT License
+
+    Copyright (c) 2020-2021 Szabó László András <hu@zza.hu>
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+
+"""
+    Boot-time config access: per-attribute JSON files vs. module stores vs. compiled module.
+
+    Upload this file via WebREPL, then: import benchmark_config
+    It creates a temporary per-attribute copy of the config in bench_config/ and removes it at the end.
+"""
+
+import gc, ujson, uos, usys
+
+from utime import ticks_diff, ticks_us
+
+import ubot_config as config
+
+
+_rounds = 5
+_legacy = "bench_config"
+
+
+
+################################
+## PUBLIC METHODS
+
+def run():
+    modules = [name[:-4] for name in uos.listdir("etc/config") if name[-4:] == ".txt" and name != "system.txt"]
+    config.compile()
+    _createLegacyCopy(modules)
+
+    try:
+        print("\nBoot-time config access, {} modules, average of {} rounds:\n".format(len(modules), _rounds))
+        _report("per-attribute JSON files", _readLegacy, modules)
+        _report("module stores (JSON)",     _readStores, modules)
+        _report("compiled module (import)", _importCompiled, modules)
+        print()
+    finally:
+        _removeLegacyCopy()
+
+
+
+################################
+## PRIVATE, HELPER METHODS
+
+def _report(title, function, modules):
+    elapsed = 0
+
+    for i in range(_rounds):
+        gc.collect()
+        start = ticks_us()
+        function(modules)
+        elapsed += ticks_diff(ticks_us(), start)
+
+    print("    {:<28}{:>10} us".format(title, elapsed // _rounds))
+
+
+def _readLegacy(modules):
+    for module in modules:
+        for fileName in uos.listdir("{}/{}".format(_legacy, module)):
+            with open("{}/{}/{}".format(_legacy, module, fileName)) as file:
+                ujson.loads(file.readline())
+
+
+def _readStores(modules):
+    for module in modules:
+        with open("etc/config/{}.txt".format(module)) as file:
+            ujson.load(file)
+
+
+def _importCompiled(modules):
+    usys.modules.pop("etc.config_compiled", None)
+    import etc.config_compiled
+
+
+def _createLegacyCopy(modules):
+    _removeLegacyCopy()
+    uos.mkdir(_legacy)
+
+    for module in modules:
+        uos.mkdir("{}/{}".format(_legacy, module))
+        for attribute, value in config.getModule(module).items():
+            with open("{}/{}/{}.txt".format(_legacy, module, attribute), "w") as file:
+                file.write("{}\n".format(ujson.dumps(value)))
+
+
+def _removeLegacyCopy():
+    try:
+        for module in uos.listdir(_legacy):
+            for fileName in uos.listdir("{}/{}".format(_legacy, module)):
+                uos.remove("{}/{}/{}".format(_legacy, module, fileName))
+            uos.rmdir("{}/{}".format(_legacy, module))
+        uos.rmdir(_legacy)
+    except OSError:
+        pass
+
+
+
+run()
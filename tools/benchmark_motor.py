@@ -0,0 +1,118 @@
+"""
+    uBot_firmware   // The firmware of the μBot, the educational floor robot. (A MicroPython port to ESP8266 with additional modules.)
+
+    This file is part of uBot_firmware.
+    [https://zza.hu/uBot_firmware]
+    [https://git.zza.hu/uBot_firmware]
+
+
+    MIT License
+
+    Copyright (c) 2020-2021 Szabó László András <hu@zza.hu>
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+
+"""
+    Move queue: list of (direction, duration) tuples with pop(0) vs. the array-backed ring buffer of ubot_motor.
+
+    Upload this file via WebREPL, then: import benchmark_motor
+    It only uses the queue of ubot_motor, the motors are not driven.
+"""
+
+import gc
+
+from utime import ticks_diff, ticks_us
+
+import ubot_motor as motor
+
+
+_moves = 10000
+
+
+
+################################
+## PUBLIC METHODS
+
+def run():
+    print("\nEnqueue and dequeue {} moves (batches of {} pending moves):\n".format(_moves, motor._queueSize))
+    _report("list, all moves pending",  _listAll)
+    _report("list, batches",            _listBatches)
+    _report("ring buffer, batches",     _ringBatches)
+    print()
+
+
+
+################################
+## PRIVATE, HELPER METHODS
+
+def _report(title, function):
+    gc.collect()
+    allocated = gc.mem_alloc()
+    start     = ticks_us()
+
+    try:
+        function()
+        result = "{:>10} us".format(ticks_diff(ticks_us(), start))
+    except MemoryError:
+        result = "{:>13}".format("MemoryError")
+
+    print("    {:<26}{}  {:>8} B allocated".format(title, result, gc.mem_alloc() - allocated))
+
+
+def _listAll():
+    moveList = []
+
+    for i in range(_moves):
+        moveList.append((i % 5, 890))
+
+    while moveList:
+        moveList.pop(0)
+
+
+def _listBatches():
+    moveList = []
+
+    for i in range(_moves):
+        moveList.append((i % 5, 890))
+
+        if len(moveList) == motor._queueSize:
+            while moveList:
+                moveList.pop(0)
+
+    while moveList:
+        moveList.pop(0)
+
+
+def _ringBatches():
+    motor.stop()
+
+    for i in range(_moves):
+        if not motor._push(i % 5, 890):
+            while motor._moveCount:
+                motor._pop()
+
+            motor._push(i % 5, 890)
+
+    while motor._moveCount:
+        motor._pop()
+
+
+
+run()
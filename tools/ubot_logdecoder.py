@@ -0,0 +1,148 @@
+"""
+    uBot_firmware   // The firmware of the μBot, the educational floor robot. (A MicroPython port to ESP8266 with additional modules.)
+
+    This file is part of uBot_firmware.
+    [https://zza.hu/uBot_firmware]
+    [https://git.zza.hu/uBot_firmware]
+
+
+    MIT License
+
+    Copyright (c) 2020-2021 Szabó László András <hu@zza.hu>
+
+    Permission is hereby granted, free of charge, to any person obtaining a copy
+    of this software and associated documentation files (the "Software"), to deal
+    in the Software without restriction, including without limitation the rights
+    to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+    copies of the Software, and to permit persons to whom the Software is
+    furnished to do so, subject to the following conditions:
+
+    The above copyright notice and this permission notice shall be included in all
+    copies or substantial portions of the Software.
+
+    THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+    IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+    FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+    AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+    LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+    OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+    SOFTWARE.
+"""
+
+"""
+    Host-side decoder of the μBot logs: binary (logger.format = "binary") and text files as well.
+    The records are stamped with ticks_ms, the wall clock time is reconstructed from the anchors.
+
+    Usage: python3 ubot_logdecoder.py log/event/0000000042.bin [...]
+
+    Download the files from http://192.168.11.1/raw/log/<type>/<file> first.
+    The record formats are described in modules/ubot_logger.py.
+"""
+
+import argparse, datetime, os, struct, sys
+
+
+BINARY_MAGIC  = b"uBL\x01"
+RECORD_HEADER = struct.Struct("<IBHH")        # ticks_ms, tag, event ID, payload length
+ANCHOR_FORMAT = struct.Struct("<HBBBBBBI")    # RTC datetime tuple
+TICKS_PERIOD  = 1 << 30                       # MicroPython's ticks_ms() wraps around at this value.
+
+TAG_ANCHOR    = 254
+TAG_TEXT      = 255
+TAG_NAMES     = {0 : "Exception", 1 : "Event", 2 : "Object"}
+
+
+
+################################
+## PUBLIC METHODS
+
+def ticksDiff(end, start):
+    """ Same as MicroPython's utime.ticks_diff(). """
+    return (end - start + TICKS_PERIOD // 2) % TICKS_PERIOD - TICKS_PERIOD // 2
+
+
+def readRecords(data):
+    """ Yields (ticks, tag, event ID, payload) tuples from the content of a binary log file. """
+    position = len(BINARY_MAGIC) if data[:len(BINARY_MAGIC)] == BINARY_MAGIC else 0  # The fallback file has no magic.
+
+    while position + RECORD_HEADER.size <= len(data):
+        ticks, tag, eventId, length = RECORD_HEADER.unpack_from(data, position)
+        position += RECORD_HEADER.size
+        yield ticks, tag, eventId, data[position : position + length]
+        position += length
+
+
+def _anchorTime(dt):
+    """ Converts the RTC datetime tuple of an anchor, with its sub-second field (ms on ESP8266). """
+    subSeconds = dt[7] if 7 < len(dt) else 0
+    return datetime.datetime(dt[0], dt[1], dt[2], dt[4], dt[5], dt[6]) + datetime.timedelta(milliseconds = subSeconds)
+
+
+def decode(data):
+    """ Yields (wall clock time or None, ticks, tag name, text) tuples. """
+    anchor = None
+    texts  = {}
+
+    for ticks, tag, eventId, payload in readRecords(data):
+        if tag == TAG_ANCHOR:
+            dt     = ANCHOR_FORMAT.unpack(payload)
+            anchor = (ticks, _anchorTime(dt))
+        elif tag == TAG_TEXT:
+            texts[eventId] = payload.decode("utf-8", "replace")
+        else:
+            text = texts.get(eventId, "<unknown event ID: {}>".format(eventId)) if eventId else payload.decode("utf-8", "replace")
+            wall = None if anchor is None else anchor[1] + datetime.timedelta(milliseconds = ticksDiff(ticks, anchor[0]))
+            yield wall, ticks, TAG_NAMES.get(tag, "Tag {}".format(tag)), text
+
+
+def decodeText(text, tagName = ""):
+    """ Yields (wall clock time or None, ticks or None, tag name, text) tuples from the content of a text log file. """
+    anchor = None
+
+    for block in text.split("\n\n"):
+        lines = block.strip("\n").split("\n")
+
+        while lines and lines[0][:2] == "@ ":                      # The anchor of a flush precedes its first record.
+            parts  = lines.pop(0).split(" ", 2)
+            dt     = [int(i) for i in parts[2].strip()[1:-1].split(",")]
+            anchor = (int(parts[1]), _anchorTime(dt))
+
+        if not lines or lines == [""]:
+            continue
+
+        if lines[0].isdigit():
+            ticks = int(lines[0])
+            wall  = None if anchor is None else anchor[1] + datetime.timedelta(milliseconds = ticksDiff(ticks, anchor[0]))
+            yield wall, ticks, tagName, "\n".join(lines[1:])
+        else:                                                       # Older files: RTC tuple instead of ticks.
+            yield None, None, tagName, "\n".join(lines)
+
+
+def main(arguments = None):
+    parser = argparse.ArgumentParser(description = "Decodes binary μBot log files into readable text.")
+    parser.add_argument("files", nargs = "+", help = "log file(s), e.g. 0000000042.bin or 0000000042.txt")
+    options = parser.parse_args(arguments)
+
+    for fileName in options.files:
+        with open(fileName, "rb") as file:
+            data = file.read()
+
+        if 1 < len(options.files):
+            print("==> {} <==".format(fileName))
+
+        if fileName[-4:] == ".txt":
+            tagName = os.path.basename(os.path.dirname(os.path.abspath(fileName))).capitalize()
+            records = decodeText(data.decode("utf-8", "replace"), tagName)
+        else:
+            records = decode(data)
+
+        for wall, ticks, tagName, text in records:
+            stamp = wall.strftime("%Y-%m-%d %H:%M:%S.%f")[:-3] if wall else "ticks {}".format(ticks) if ticks is not None else "-"
+            lines = text.rstrip("\n").split("\n")
+            print("{}  {:<9}  {}".format(stamp, tagName, lines[0]))
+            for line in lines[1:]:
+                print("{}{}".format(" " * 36, line))
+
+
+if __name__ == "__main__":
+    sys.exit(main())